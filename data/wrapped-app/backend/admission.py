@@ -0,0 +1,104 @@
+import os
+import threading
+
+from jobs import JOB_WORKERS
+
+# Requests allowed to wait for a free analysis worker; beyond this they get a 429
+MAX_QUEUED = int(os.environ.get('WRAPPED_MAX_QUEUED', '8'))
+# Upload bytes held by admitted (running or queued) analyses at once
+MAX_INFLIGHT_BYTES = int(os.environ.get('WRAPPED_MAX_INFLIGHT_BYTES', str(1024 * 1024 * 1024)))
+# Per-request limits
+MAX_FILES = int(os.environ.get('WRAPPED_MAX_FILES', '200'))
+MAX_FILE_BYTES = int(os.environ.get('WRAPPED_MAX_FILE_BYTES', str(256 * 1024 * 1024)))
+# Seconds clients are told to wait before retrying a rejected request
+RETRY_AFTER = int(os.environ.get('WRAPPED_RETRY_AFTER', '10'))
+
+
+class AdmissionError(Exception):
+    """A request the service won't take: 413 if it never could, 429 if it's busy."""
+
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Admission:
+    """
+    Bounds the analyses a process accepts.
+
+    Each admitted request holds one slot and its upload bytes until its
+    analysis finishes. There are workers + max_queued slots, so at most
+    max_queued requests wait in the job pool's queue behind the running ones.
+    """
+
+    def __init__(self, workers, max_queued, max_bytes, max_files, max_file_bytes, retry_after):
+        self.workers = max(1, workers)
+        self.slots = self.workers + max(0, max_queued)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.retry_after = retry_after
+        self.active = 0
+        self.bytes = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def check_request(self, sizes):
+        """Reject (413) a request that is too big to ever be admitted."""
+        if len(sizes) > self.max_files:
+            raise AdmissionError(413, f"Too many files: {len(sizes)} (limit {self.max_files}).")
+        for size in sizes:
+            if size > self.max_file_bytes:
+                raise AdmissionError(413, f"File too large: {size} bytes (limit {self.max_file_bytes}).")
+        if sum(sizes) > self.max_bytes:
+            raise AdmissionError(413, f"Upload too large: {sum(sizes)} bytes (limit {self.max_bytes}).")
+
+    def admit(self, sizes):
+        """
+        Take a slot for a request with the given file sizes, or raise
+        AdmissionError. Returns a release() callable; calling it more than
+        once is harmless.
+        """
+        self.check_request(sizes)
+        nbytes = sum(sizes)
+        with self._lock:
+            if self.active >= self.slots or self.bytes + nbytes > self.max_bytes:
+                self.rejected += 1
+                raise AdmissionError(429, "Too many analyses in progress, try again later.", self.retry_after)
+            self.active += 1
+            self.bytes += nbytes
+
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self.active -= 1
+                self.bytes -= nbytes
+
+        return release
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": min(self.active, self.workers),
+                "queued": max(0, self.active - self.workers),
+                "in_flight_bytes": self.bytes,
+                "rejected": self.rejected,
+                "slots": self.slots,
+                "max_in_flight_bytes": self.max_bytes,
+            }
+
+
+_default_admission = None
+
+
+def get_admission():
+    global _default_admission
+    if _default_admission is None:
+        _default_admission = Admission(JOB_WORKERS, MAX_QUEUED, MAX_INFLIGHT_BYTES, MAX_FILES, MAX_FILE_BYTES, RETRY_AFTER)
+    return _default_admission
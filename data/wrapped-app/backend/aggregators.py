@@ -0,0 +1,902 @@
+import heapq
+import os
+import random
+import re
+from array import array
+from collections import defaultdict, Counter
+from contextlib import nullcontext
+from datetime import datetime, timezone, timedelta
+
+try:
+    # Vectorized chronological passes; the pure-Python loop is used without it
+    import numpy as np
+except ImportError:
+    np = None
+
+from lexicon import get_lexicon
+from network import build_network_data
+from text_utils import fix_name, fix_text, is_url
+
+# Bump whenever aggregator state changes shape or meaning so cached partials
+# from an older version are never merged into new results.
+STATE_VERSION = 8
+
+# Timezone used for the time-of-day and month stats: UTC-8 (PST)
+PST_TZ = timezone(timedelta(hours=-8))
+_PST_OFFSET_MS = int(PST_TZ.utcoffset(None).total_seconds() * 1000)
+
+_IMAGE_EXT_RE = re.compile(r'\.(png|jpe?g|gif|bmp|webp)$', re.I)
+_MEDIA_NAME_RE = re.compile(r'(IMG[_-]\d+|Screenshot_?\d+|\d{8}_\d{6}|\.(png|jpe?g))', re.I)
+
+
+class MessageView:
+    """
+    A single message handed to every aggregator.
+
+    The sender name is repaired once up front; the repaired content (shared by
+    the word and likes paths), the cleaned text, its tokens and the attached
+    media are computed lazily and shared by all aggregators that read them.
+    """
+    __slots__ = ('raw', 'sender', 'lexicon', '_content', '_text', '_tokens', '_liked_text', '_media', '_is_reel')
+
+    _UNSET = object()
+
+    def __init__(self, raw, sender, lexicon):
+        self.raw = raw
+        self.sender = sender
+        self.lexicon = lexicon
+        self._content = self._UNSET
+        self._text = self._UNSET
+        self._tokens = None
+        self._liked_text = self._UNSET
+        self._media = None
+        self._is_reel = None
+
+    @property
+    def has_content(self):
+        return 'content' in self.raw
+
+    @property
+    def content(self):
+        # Message content with mojibake repaired, computed once
+        if self._content is self._UNSET:
+            self._content = fix_text(self.raw.get('content'))
+        return self._content
+
+    @property
+    def text(self):
+        # Expanded, lowercased content (so "that's" -> "that is" and gets removed by stopwords)
+        if self._text is self._UNSET:
+            self._text = self.lexicon.expand_contractions(self.content)
+        return self._text
+
+    @property
+    def tokens(self):
+        # (word tokens, profanity hits, longest alphabetic word), see Lexicon.tokenize()
+        if self._tokens is None:
+            self._tokens = self.lexicon.tokenize(self.text)
+        return self._tokens
+
+    @property
+    def liked_text(self):
+        # Repaired content of a reacted message, or None for unreacted and media-only ones
+        if self._liked_text is self._UNSET:
+            raw_content = self.raw.get('content', '')
+            if not self.raw.get('reactions') or not raw_content or raw_content == '[Media/No Content]':
+                self._liked_text = None
+            else:
+                self._liked_text = self.content
+        return self._liked_text
+
+    @property
+    def media(self):
+        # (media count, referenced URIs)
+        if self._media is None:
+            self._media = _message_media(self.raw)
+        return self._media
+
+    @property
+    def is_reel(self):
+        if self._is_reel is None:
+            share = self.raw.get('share')
+            self._is_reel = self.has_content and (
+                "instagram.com/reel" in self.text
+                or (isinstance(share, dict) and 'link' in share and "instagram.com/reel" in share['link'])
+            )
+        return self._is_reel
+
+
+class Aggregator:
+    """
+    Base class for one statistic.
+
+    update(message) folds a MessageView in, merge(other) folds in a partial
+    aggregate of the same type computed over another file or chunk, and
+    finalize() returns the statistic's result. Aggregators only hold plain
+    containers so partial results can be pickled.
+    """
+
+    def update(self, message):
+        raise NotImplementedError
+
+    def merge(self, other):
+        raise NotImplementedError
+
+    def finalize(self):
+        raise NotImplementedError
+
+
+class CounterAggregator(Aggregator):
+    """Per-sender tally; finalize() returns the top 10."""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        return self
+
+    def finalize(self, n=10):
+        return self.counts.most_common(n)
+
+
+class MessagesSent(CounterAggregator):
+    def update(self, message):
+        self.counts[message.sender] += 1
+
+
+class TotalChars(CounterAggregator):
+    def update(self, message):
+        if message.has_content:
+            self.counts[message.sender] += len(message.text)
+
+
+class ProfanityCounts(CounterAggregator):
+    def update(self, message):
+        if not message.has_content:
+            return
+        hits = message.tokens[1]
+        if hits:
+            self.counts[message.sender] += hits
+
+
+class ReelsSent(CounterAggregator):
+    def update(self, message):
+        if message.is_reel:
+            self.counts[message.sender] += 1
+
+
+class WordCounts(Aggregator):
+    """Word frequencies per user and overall, after stopword filtering."""
+
+    def __init__(self):
+        self.per_user = defaultdict(Counter)
+        self.total = Counter()
+
+    def update(self, message):
+        if not message.has_content:
+            return
+        words = message.tokens[0]
+        self.per_user[message.sender].update(words)
+        self.total.update(words)
+
+    def merge(self, other):
+        for user, counter in other.per_user.items():
+            self.per_user[user].update(counter)
+        self.total.update(other.total)
+        return self
+
+    def finalize(self):
+        top_words_per_user = {}
+        for user, counter in self.per_user.items():
+            top_words_per_user[user] = counter.most_common(10)
+        return top_words_per_user, self.total.most_common(10)
+
+
+class LongestWords(Aggregator):
+    """Longest purely alphabetic word each user has sent."""
+
+    def __init__(self):
+        self.longest = {}
+
+    def update(self, message):
+        if not message.has_content:
+            return
+        longest = message.tokens[2]
+        if longest:
+            self._offer(message.sender, longest)
+
+    def _offer(self, user, word):
+        if len(word) > self.longest.get(user, ("", 0))[1]:
+            self.longest[user] = (word, len(word))
+
+    def merge(self, other):
+        for user, (word, _) in other.longest.items():
+            self._offer(user, word)
+        return self
+
+    def finalize(self):
+        longest_word_list = [{"user": u, "word": w, "length": l} for u, (w, l) in self.longest.items()]
+        return sorted(longest_word_list, key=lambda x: x['length'], reverse=True)[:10]
+
+
+class Reactions(Aggregator):
+    """Likes received and given per user, plus the actor -> sender likes matrix."""
+
+    def __init__(self):
+        self.received = Counter()
+        self.given = Counter()
+        self.matrix = defaultdict(Counter)
+
+    def update(self, message):
+        reactions = message.raw.get('reactions')
+        if not reactions:
+            return
+        sender = message.sender
+        self.received[sender] += len(reactions)
+
+        # Track who GAVE the likes
+        for reaction in reactions:
+            if 'actor' in reaction:
+                actor = fix_name(reaction['actor'])
+                if actor == "Meta AI":
+                    continue
+                self.given[actor] += 1
+                self.matrix[actor][sender] += 1
+
+    def merge(self, other):
+        self.received.update(other.received)
+        self.given.update(other.given)
+        for actor, counter in other.matrix.items():
+            self.matrix[actor].update(counter)
+        return self
+
+    def finalize(self):
+        # Most Messages Liked (Likes Given)
+        return self.given.most_common(10)
+
+
+class TopLikedMessages(Aggregator):
+    """
+    The 10 most reacted-to messages, kept in a bounded min-heap. Ties go to
+    the message that arrived first, exactly like a stable sort of every
+    liked message would.
+    """
+    SIZE = 10
+
+    def __init__(self):
+        # (likes, -arrival, message); heap[0] is the first to be pushed out
+        self.heap = []
+        self.arrivals = 0
+
+    def _offer(self, msg):
+        entry = (msg['likes'], -self.arrivals, msg)
+        self.arrivals += 1
+        if len(self.heap) < self.SIZE:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def update(self, message):
+        fixed_content = message.liked_text
+        if fixed_content is None:
+            return
+        self._offer({
+            "content": fixed_content,
+            "sender": message.sender,
+            "likes": len(message.raw['reactions']),
+            "timestamp": message.raw.get('timestamp_ms', 0)
+        })
+
+    def merge(self, other):
+        # Anything outside other's top 10 could never make the merged top 10
+        for _, _, msg in sorted(other.heap, key=lambda e: -e[1]):
+            self._offer(msg)
+        return self
+
+    def finalize(self):
+        return [msg for _, _, msg in sorted(self.heap, key=lambda e: (-e[0], -e[1]))]
+
+
+class QuizPool(Aggregator):
+    """
+    Liked, sentence-sized messages for the 'who said it' quiz.
+
+    Keeps a uniform reservoir sample of up to SAMPLE_PER_SENDER messages per
+    sender plus how many each sender had, so memory is O(senders) however
+    long the chat is. Sampling uses a seedable RNG so quizzes can be
+    reproduced.
+    """
+    SAMPLE_PER_SENDER = 5
+    QUIZ_SIZE = 15
+    # Senders that get one question each before anyone gets a second one
+    DISTINCT_SENDERS = 11
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.samples = {}
+        self.totals = Counter()
+
+    def update(self, message):
+        fixed_content = message.liked_text
+        if fixed_content is None:
+            return
+        if not (30 < len(fixed_content) < 150) or is_url(fixed_content):
+            return
+        sender = message.sender
+        self.totals[sender] += 1
+        sample = self.samples.setdefault(sender, [])
+        if len(sample) < self.SAMPLE_PER_SENDER:
+            sample.append(fixed_content)
+        else:
+            j = self.rng.randrange(self.totals[sender])
+            if j < self.SAMPLE_PER_SENDER:
+                sample[j] = fixed_content
+
+    def _merge_samples(self, a, a_total, b, b_total):
+        # Draw without replacement from the union, picking a side in proportion
+        # to how many messages it still stands for
+        rng = self.rng
+        a, b = rng.sample(a, len(a)), rng.sample(b, len(b))
+        merged = []
+        while len(merged) < self.SAMPLE_PER_SENDER and (a_total or b_total):
+            if rng.randrange(a_total + b_total) < a_total:
+                merged.append(a.pop())
+                a_total -= 1
+            else:
+                merged.append(b.pop())
+                b_total -= 1
+        return merged
+
+    def merge(self, other):
+        for sender, theirs in other.samples.items():
+            mine = self.samples.get(sender)
+            if mine:
+                self.samples[sender] = self._merge_samples(mine, self.totals[sender], theirs, other.totals[sender])
+            else:
+                self.samples[sender] = list(theirs)
+            self.totals[sender] += other.totals[sender]
+        return self
+
+    def finalize(self):
+        rng = self.rng
+        # Order senders as they would first appear in a shuffle of every
+        # eligible message (weighted sampling without replacement)
+        order = sorted(self.samples, key=lambda s: rng.random() ** (1.0 / self.totals[s]), reverse=True)
+        remaining = {s: rng.sample(self.samples[s], len(self.samples[s])) for s in order}
+
+        # One message per sender first to get a diverse set for the quiz
+        final_quiz = []
+        for sender in order[:min(self.DISTINCT_SENDERS, self.QUIZ_SIZE)]:
+            final_quiz.append({"content": remaining[sender].pop(), "sender": sender})
+
+        # Once enough different senders are in, fill up from anyone
+        if len(order) >= self.DISTINCT_SENDERS:
+            while len(final_quiz) < self.QUIZ_SIZE:
+                candidates = [s for s in order if remaining[s]]
+                if not candidates:
+                    break
+                sender = rng.choices(candidates, weights=[self.totals[s] for s in candidates])[0]
+                final_quiz.append({"content": remaining[sender].pop(), "sender": sender})
+        return final_quiz
+
+
+def _message_media(message):
+    """Count media attached to a raw message and collect the URIs it references."""
+    media_count = 0
+    media_uris = []
+
+    # Explicit photo lists
+    photos = message.get('photos')
+    if isinstance(photos, list):
+        media_count += len(photos)
+        for p in photos:
+            if isinstance(p, dict):
+                uri = p.get('uri') or p.get('uri_image') or p.get('uri_raw') or p.get('url')
+                if isinstance(uri, str) and uri:
+                    media_uris.append(uri)
+    elif photos:
+        media_count += 1
+
+    # Videos
+    videos = message.get('videos')
+    if isinstance(videos, list):
+        media_count += len(videos)
+        for v in videos:
+            if isinstance(v, dict):
+                uri = v.get('uri') or v.get('url')
+                if isinstance(uri, str) and uri:
+                    media_uris.append(uri)
+    elif videos:
+        media_count += 1
+
+    # GIFs
+    gifs = message.get('gifs')
+    if isinstance(gifs, list):
+        media_count += len(gifs)
+        for g in gifs:
+            if isinstance(g, dict):
+                uri = g.get('uri') or g.get('url')
+                if isinstance(uri, str) and uri:
+                    media_uris.append(uri)
+    elif gifs:
+        media_count += 1
+
+    # Sticker
+    if 'sticker' in message:
+        media_count += 1
+        st = message.get('sticker')
+        if isinstance(st, dict):
+            uri = st.get('uri') or st.get('url')
+            if isinstance(uri, str) and uri:
+                media_uris.append(uri)
+
+    # Attachments: often where screenshots live
+    for att in message.get('attachments', []) or []:
+        if not isinstance(att, dict):
+            continue
+        atype = (att.get('type') or '').lower()
+
+        # Common attachment types that represent media
+        if atype in ('photo', 'image', 'video', 'gif', 'sticker', 'file'):
+            media_count += 1
+            media = att.get('media') or att.get('image') or att.get('photo') or {}
+            if isinstance(media, dict):
+                uri = media.get('uri') or media.get('uri_image') or media.get('uri_raw') or media.get('url') or media.get('src')
+                if isinstance(uri, str) and uri:
+                    media_uris.append(uri)
+            continue
+
+        # Fallback: check nested media/image dicts for file URIs
+        media = att.get('media') or att.get('image') or att.get('photo') or {}
+        if isinstance(media, dict):
+            uri = media.get('uri') or media.get('uri_image') or media.get('url') or media.get('src')
+            if isinstance(uri, str) and _IMAGE_EXT_RE.search(uri):
+                media_count += 1
+                media_uris.append(uri)
+
+    # Files array (some exports put attachments here)
+    for f in message.get('files', []) or []:
+        if isinstance(f, dict):
+            uri = f.get('uri') or f.get('uri_raw') or f.get('name') or f.get('file')
+            if isinstance(uri, str) and _IMAGE_EXT_RE.search(uri):
+                media_count += 1
+                media_uris.append(uri)
+
+    # Share links that might point to images
+    share = message.get('share') or {}
+    if isinstance(share, dict):
+        link = share.get('link') or share.get('href')
+        if isinstance(link, str) and _IMAGE_EXT_RE.search(link):
+            media_count += 1
+            media_uris.append(link)
+
+    # Heuristic: filenames embedded in content (IMG_, Screenshot, date patterns)
+    if media_count == 0:
+        content_for_media = message.get('content', '')
+        if isinstance(content_for_media, str) and _MEDIA_NAME_RE.search(content_for_media):
+            media_count += 1
+
+    return media_count, media_uris
+
+
+def _media_basenames(media_uris):
+    """Collect file basenames of local media URIs so the zipper can find them in the export."""
+    basenames = []
+    for uri in media_uris:
+        if not isinstance(uri, str):
+            continue
+        u = uri.strip()
+        # data-URIs and absolute URLs have no file in the export
+        if u.startswith('data:') or re.search(r'https?://', u):
+            continue
+
+        # Strip common leading path fragments; some exports prefix with 'photos/' or 'images/'
+        u_clean = re.sub(r'^(?:\./|\.\./|/)+', '', u)
+        base = os.path.basename(u_clean)
+        if base and base not in basenames:
+            basenames.append(base)
+    return basenames
+
+
+class MediaCounts(CounterAggregator):
+    """Image/media stats (robust detection for screenshots and attachments)."""
+
+    def __init__(self):
+        super().__init__()
+        self.basenames = set()
+
+    def update(self, message):
+        # Reacted messages without text have never been counted as media
+        if message.raw.get('reactions') and message.liked_text is None:
+            return
+        media_count, media_uris = message.media
+        if not media_count:
+            return
+        self.counts[message.sender] += media_count
+        if media_uris:
+            self.basenames.update(_media_basenames(media_uris))
+
+    def merge(self, other):
+        super().merge(other)
+        self.basenames.update(other.basenames)
+        return self
+
+    def media_files(self):
+        return sorted(self.basenames)
+
+
+def _month_label(month_index):
+    # Months since January 1970 -> e.g. "March 2024"
+    year, month = divmod(int(month_index), 12)
+    return datetime(1970 + year, month + 1, 1).strftime('%B %Y')
+
+
+def _count_in_order(counter, keys, label, weights=None):
+    """
+    Add the occurrences (or summed integer weights) of each key in a NumPy
+    array to counter, inserting new keys in first-seen order exactly like a
+    sequential loop would, so most_common() tie-breaking is unchanged.
+    """
+    if not len(keys):
+        return
+    uniq, first = np.unique(keys, return_index=True)
+    totals = np.bincount(np.searchsorted(uniq, keys), weights=weights, minlength=len(uniq))
+    totals = totals.round().astype(np.int64).tolist()
+    for k in np.argsort(first, kind='stable').tolist():
+        counter[label(uniq[k])] += totals[k]
+
+
+class MessageTable:
+    """
+    Compact columnar store of the messages the chronological phase needs:
+    int64 timestamps and int32 IDs into an interned sender list. Nothing else
+    from the parsed JSON is retained, so each message dict can be freed as
+    soon as it has been counted.
+    """
+    __slots__ = ('timestamps', 'senders', 'names', '_ids')
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.senders = array('i')
+        self.names = []
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def intern(self, name):
+        sender_id = self._ids.get(name)
+        if sender_id is None:
+            sender_id = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return sender_id
+
+    def append(self, timestamp_ms, sender):
+        self.timestamps.append(timestamp_ms)
+        self.senders.append(self.intern(sender))
+
+    def extend(self, other):
+        remap = [self.intern(name) for name in other.names]
+        self.timestamps.extend(other.timestamps)
+        if np is not None and len(other.senders):
+            ids = np.asarray(remap, dtype=np.int32)[np.frombuffer(other.senders, dtype=np.int32)]
+            self.senders.frombytes(ids.tobytes())
+        else:
+            self.senders.extend(remap[i] for i in other.senders)
+
+    def sort_tail(self, start):
+        """
+        Stable-sort rows[start:] by timestamp. If any of them is older than
+        row start - 1 the whole table is re-sorted instead; returns the first
+        row whose position may have changed.
+        """
+        ts = self.timestamps
+        if np is not None:
+            ts_np = np.frombuffer(ts, dtype=np.int64)
+            order = start + np.argsort(ts_np[start:], kind='stable')
+            if start and ts_np[order[0]] < ts_np[start - 1]:
+                start = 0
+                order = np.argsort(ts_np, kind='stable')
+            del ts_np
+            for name, fmt in (('timestamps', np.int64), ('senders', np.int32)):
+                column = getattr(self, name)
+                reordered = np.frombuffer(column, dtype=fmt)[order].tobytes()
+                del column[start:]
+                column.frombytes(reordered)
+        else:
+            order = sorted(range(start, len(ts)), key=ts.__getitem__)
+            if start and ts[order[0]] < ts[start - 1]:
+                start = 0
+                order = sorted(range(len(ts)), key=ts.__getitem__)
+            for column in (self.timestamps, self.senders):
+                column[start:] = array(column.typecode, [column[i] for i in order])
+        return start
+
+
+class Timeline(Aggregator):
+    """
+    Chronological stats: night owls, morning people, peak month, most replied
+    to and response times.
+
+    Messages are kept in a MessageTable whose first `folded` rows are sorted
+    and already counted. finalize() only sorts and counts the messages merged
+    since the last call, pairing the previous last message with the first new
+    one, so appending newer messages to a snapshot costs O(new). Merging in
+    messages older than the counted ones falls back to a full recount. The
+    passes run vectorized with NumPy when it is installed.
+    """
+
+    def __init__(self):
+        self.table = MessageTable()
+        self._reset()
+
+    def _reset(self):
+        self.folded = 0
+        self.night_owl_counts = Counter()
+        self.morning_person_counts = Counter()
+        self.replied_to_counts = Counter()
+        self.month_counts = Counter()
+        # Integer milliseconds, so sums don't depend on merge or append order
+        self.response_time_ms = Counter()
+        self.response_time_counts = Counter()
+
+    def update(self, message):
+        raw = message.raw
+        if 'timestamp_ms' not in raw:
+            return
+        try:
+            # Some exports carry float timestamps; the table stores int64
+            self.table.append(int(raw['timestamp_ms']), message.sender)
+        except (TypeError, ValueError, OverflowError):
+            # Unusable timestamp: leave this message out of the timeline only
+            return
+
+    def merge(self, other):
+        # Only messages are taken over; they get counted by our next finalize()
+        self.table.extend(other.table)
+        return self
+
+    def _fold_python(self, start):
+        ts, senders, names = self.table.timestamps, self.table.senders, self.table.names
+        for i in range(start, len(ts)):
+            ts_ms, sender = ts[i], names[senders[i]]
+
+            # Convert to datetime in PST
+            dt = datetime.fromtimestamp(ts_ms / 1000.0, tz=PST_TZ)
+            hour = dt.hour
+
+            # Night Owl: 12 AM - 5 AM (0 - 5)
+            if 0 <= hour < 5:
+                self.night_owl_counts[sender] += 1
+
+            # Morning Person: 6 AM - 11 AM (6 - 11)
+            elif 6 <= hour < 12:
+                self.morning_person_counts[sender] += 1
+
+            # Peak Activity Month
+            self.month_counts[dt.strftime('%B %Y')] += 1
+
+            if i == 0:
+                continue
+            prev_ts, prev_sender = ts[i - 1], names[senders[i - 1]]
+            if prev_sender != sender:
+                time_diff = (ts_ms - prev_ts) / 1000.0 # seconds
+
+                # Most Replied To Heuristic: answered within 5 minutes
+                if time_diff < 300:
+                    self.replied_to_counts[prev_sender] += 1
+
+                # Response time, only within a reasonable "conversation" window, e.g., 12 hours
+                if time_diff < 43200:
+                    self.response_time_ms[sender] += ts_ms - prev_ts
+                    self.response_time_counts[sender] += 1
+
+    def _fold_numpy(self, start):
+        ts = np.frombuffer(self.table.timestamps, dtype=np.int64).copy()
+        sid = np.frombuffer(self.table.senders, dtype=np.int32).copy()
+        name_of = self.table.names.__getitem__
+
+        # Hour of day and month bucket in PST straight from the integer timestamps
+        local_ms = ts[start:] + _PST_OFFSET_MS
+        hours = (local_ms // 3_600_000) % 24
+        new_sid = sid[start:]
+        # Night Owl: 12 AM - 5 AM; Morning Person: 6 AM - 11 AM
+        _count_in_order(self.night_owl_counts, new_sid[hours < 5], name_of)
+        _count_in_order(self.morning_person_counts, new_sid[(hours >= 6) & (hours < 12)], name_of)
+        months = local_ms.astype('datetime64[ms]').astype('datetime64[M]').astype(np.int64)
+        _count_in_order(self.month_counts, months, _month_label)
+
+        # Consecutive pairs (i - 1, i) for every newly counted message i
+        lo = max(start, 1)
+        if lo >= len(ts):
+            return
+        prev_sid, cur_sid = sid[lo - 1:-1], sid[lo:]
+        diff = ts[lo:] - ts[lo - 1:-1]
+        switched = prev_sid != cur_sid
+        # Most Replied To: answered within 5 minutes
+        _count_in_order(self.replied_to_counts, prev_sid[switched & (diff < 300_000)], name_of)
+        # Response time within a 12 hour conversation window
+        responded = switched & (diff < 43_200_000)
+        responders = cur_sid[responded]
+        _count_in_order(self.response_time_ms, responders, name_of, weights=diff[responded])
+        _count_in_order(self.response_time_counts, responders, name_of)
+
+    def finalize(self):
+        # Sort the new messages by timestamp for time-based analysis
+        if self.folded < len(self.table):
+            start = self.table.sort_tail(self.folded)
+            if start == 0:
+                # Older messages arrived: recount everything
+                self._reset()
+            if np is not None:
+                self._fold_numpy(start)
+            else:
+                self._fold_python(start)
+            self.folded = len(self.table)
+
+        avg_response_times = []
+        for user, total_ms in self.response_time_ms.items():
+            count = self.response_time_counts[user]
+            if count >= 5:
+                avg_response_times.append([user, total_ms / count / 1000.0])
+
+        month_counts = self.month_counts
+        return {
+            "night_owls": self.night_owl_counts.most_common(10),
+            "morning_person": self.morning_person_counts.most_common(10),
+            "most_replied_to": self.replied_to_counts.most_common(10),
+            "avg_response_times": sorted(avg_response_times, key=lambda x: x[1])[:10], # Fastest first
+            "slowest_responders": sorted(avg_response_times, key=lambda x: x[1], reverse=True)[:10],
+            "peak_month": month_counts.most_common(1)[0] if month_counts else ("None", 0),
+        }
+
+
+def _untimed(name):
+    return nullcontext()
+
+
+class ChatStats:
+    """
+    All aggregators for one chat. Build one per file or chunk, merge the
+    partials in upload order, then finalize() into the /upload response shape.
+    Messages are tokenized with the registered lexicon for `locale`; seed
+    makes the quiz sample reproducible.
+    """
+
+    def __init__(self, locale=None, seed=None):
+        self.locale = get_lexicon(locale).locale
+        self.messages_sent = MessagesSent()
+        self.word_counts = WordCounts()
+        self.profanity = ProfanityCounts()
+        self.longest_words = LongestWords()
+        self.total_chars = TotalChars()
+        self.reels = ReelsSent()
+        self.reactions = Reactions()
+        self.top_liked = TopLikedMessages()
+        self.quiz_pool = QuizPool(seed)
+        self.media = MediaCounts()
+        self.timeline = Timeline()
+        # Content hashes of the export parts merged into this chat
+        self.part_keys = set()
+        # Why a single part's analysis stopped early (see analyse_part), if it did
+        self.error = None
+
+    def aggregators(self):
+        return [
+            self.messages_sent, self.word_counts, self.profanity, self.longest_words,
+            self.total_chars, self.reels, self.reactions, self.top_liked, self.quiz_pool,
+            self.media, self.timeline,
+        ]
+
+    def phases(self):
+        # aggregators() grouped by the timing phase their work is reported under
+        return (
+            ('tokenize', (self.messages_sent, self.word_counts, self.profanity, self.longest_words, self.total_chars, self.quiz_pool)),
+            ('reactions', (self.reactions, self.top_liked)),
+            ('media', (self.reels, self.media)),
+            ('chronological', (self.timeline,)),
+        )
+
+    def update(self, message, clock=None):
+        if 'sender_name' not in message:
+            return
+        sender = fix_name(message['sender_name'])
+        # Exclude Meta AI
+        if sender == "Meta AI":
+            return
+        view = MessageView(message, sender, get_lexicon(self.locale))
+        if clock is None or not clock.active:
+            for agg in self.aggregators():
+                agg.update(view)
+            return
+        # Sampled message (see timings.SampledClock); aggregators are independent,
+        # so updating them phase by phase gives the same result
+        for phase, aggs in self.phases():
+            for agg in aggs:
+                agg.update(view)
+            clock.lap(phase)
+
+    def merge(self, other):
+        if other.locale != self.locale:
+            raise ValueError(f"Cannot merge {other.locale} results into {self.locale} results")
+        for mine, theirs in zip(self.aggregators(), other.aggregators()):
+            mine.merge(theirs)
+        self.part_keys |= other.part_keys
+        return self
+
+    def finalize(self, timings=None):
+        phase = timings.phase if timings is not None else _untimed
+        with phase('rankings'):
+            return self._finalize(phase)
+
+    def _finalize(self, phase):
+        user_messages_sent = self.messages_sent.counts
+        user_likes_received = self.reactions.received
+        user_total_chars = self.total_chars.counts
+
+        top_words_per_user, top_words_overall = self.word_counts.finalize()
+        media_files = self.media.media_files()
+
+        # Average Message Length
+        avg_lengths = []
+        for user in user_messages_sent:
+            if user_messages_sent[user] > 0:
+                avg_lengths.append([user, user_total_chars[user] / user_messages_sent[user]])
+
+        # Most Aura (Likes Received / Messages Sent)
+        # Higher Ratio = Better Aura (More likes per message)
+        aura_scores = []
+        for user in user_messages_sent:
+            sent = user_messages_sent[user]
+            # Filter out low activity users
+            if sent < 10:
+                continue
+            aura_scores.append([user, user_likes_received[user] / sent])
+
+        stats = {
+            "top_words_per_user": top_words_per_user,
+            "top_words_overall": top_words_overall,
+            "top_liked_messages": self.top_liked.finalize(),
+            "top_image_senders": self.media.finalize(),
+            "quiz_pool": self.quiz_pool.finalize(),
+            # Expose detected media basenames so the UI can show share buttons;
+            # process_uploaded_data adds the available share methods
+            "media_files": media_files,
+        }
+
+        with phase('chronological'):
+            timeline = self.timeline.finalize()
+        rankings = {
+            "night_owls": timeline["night_owls"],
+            "morning_person": timeline["morning_person"],
+            "most_replied_to": timeline["most_replied_to"],
+            "most_reels_sent": self.reels.finalize(),
+            "longest_word_sent": self.longest_words.finalize(),
+            "most_aura": sorted(aura_scores, key=lambda x: x[1], reverse=True)[:10],
+            "most_messages_liked": self.reactions.finalize(),
+            "most_profanity": self.profanity.finalize(),
+            "avg_response_times": timeline["avg_response_times"],
+            "slowest_responders": timeline["slowest_responders"],
+            "avg_message_lengths": sorted(avg_lengths, key=lambda x: x[1], reverse=True)[:10],
+            "peak_month": timeline["peak_month"],
+        }
+
+        participants = sorted(user_messages_sent.keys())
+        with phase('network'):
+            network_data = build_network_data(participants, self.reactions.matrix, self.reactions.given)
+
+        chart_data = {
+            "messages_sent": [{"name": u, "value": v} for u, v in user_messages_sent.most_common(15)],
+            "likes_given": [{"name": u, "value": v} for u, v in self.reactions.given.most_common(15)],
+            "likes_received": [{"name": u, "value": v} for u, v in user_likes_received.most_common(15)],
+            "reels_sent": [{"name": u, "value": v} for u, v in self.reels.counts.most_common(15)],
+        }
+
+        return {
+            "stats": stats,
+            "rankings": rankings,
+            "network_data": network_data,
+            "chart_data": chart_data,
+            "media_files": media_files,
+        }
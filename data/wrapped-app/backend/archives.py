@@ -0,0 +1,124 @@
+import functools
+import gzip
+import os
+import re
+import zipfile
+
+# message_N.json parts of a conversation inside an Instagram/Facebook export
+_MESSAGE_MEMBER_RE = re.compile(r'(?:^|/)messages/inbox/([^/]+)/message_(\d+)\.json$')
+# Anything else stored under a conversation (photos/, videos/, audio/, ...)
+_THREAD_MEMBER_RE = re.compile(r'(?:^|/)messages/inbox/([^/]+)/.+$')
+
+_ZIP_MAGIC = b'PK\x03\x04'
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _magic(stream, n):
+    start = stream.tell()
+    head = stream.read(n)
+    stream.seek(start)
+    return head
+
+
+def _stream_size(stream):
+    start = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(start)
+    return size
+
+
+def _gzip_size(stream):
+    # ISIZE trailer: uncompressed length modulo 2**32
+    start = stream.tell()
+    stream.seek(-4, os.SEEK_END)
+    size = int.from_bytes(stream.read(4), 'little')
+    stream.seek(start)
+    return max(size, _stream_size(stream))
+
+
+def _scan_zip(zf):
+    # One pass over the central directory finds both kinds of member:
+    # {thread: [(N, info)]} for message parts, {thread: {basename: info}} for media
+    threads = {}
+    media = {}
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        m = _MESSAGE_MEMBER_RE.search(info.filename)
+        if m:
+            threads.setdefault(m.group(1), []).append((int(m.group(2)), info))
+            continue
+        m = _THREAD_MEMBER_RE.search(info.filename)
+        if m:
+            media.setdefault(m.group(1), {}).setdefault(os.path.basename(info.filename), info)
+    return threads, media
+
+
+def _pick_thread(available, thread):
+    if thread is None:
+        if len(available) > 1:
+            raise ValueError(f"Archive holds {len(available)} conversations, choose one with thread: {', '.join(sorted(available))}")
+        return next(iter(available), None)
+    if thread not in available:
+        raise ValueError(f"Conversation '{thread}' not found in archive.")
+    return thread
+
+
+def zip_parts(stream, thread=None):
+    """
+    Message parts and media of one conversation in an export .zip.
+
+    Members are read straight out of the (seekable) archive, nothing is
+    extracted. Returns (parts, media): parts are file_info dicts in
+    message_N order, media maps each media basename to its member name.
+    thread picks the conversation (its inbox directory name) when the
+    archive holds more than one; otherwise ValueError is raised.
+    """
+    zf = zipfile.ZipFile(stream)
+    threads, media = _scan_zip(zf)
+    thread = _pick_thread(threads, thread)
+    parts = [
+        {"filename": info.filename, "stream": zf.open(info), "size": info.file_size}
+        for _, info in sorted(threads.get(thread, ()), key=lambda t: t[0])
+    ]
+    return parts, {name: info.filename for name, info in media.get(thread, {}).items()}
+
+
+def zip_threads(stream):
+    """Names of the conversations with message parts in an export .zip."""
+    threads, _ = _scan_zip(zipfile.ZipFile(stream))
+    return sorted(threads)
+
+
+def upload_media(filename, stream, thread=None):
+    """
+    basename -> zero-argument opener for the media in one uploaded file:
+    the members stored under a conversation in an export .zip, or the file
+    itself for anything else.
+    """
+    stream.seek(0)
+    if _magic(stream, 4).startswith(_ZIP_MAGIC):
+        zf = zipfile.ZipFile(stream)
+        _, media = _scan_zip(zf)
+        return {name: functools.partial(zf.open, info) for name, info in media.get(_pick_thread(media, thread), {}).items()}
+    return {os.path.basename(filename): lambda: stream}
+
+
+def upload_parts(filename, stream, thread=None):
+    """
+    Expand one uploaded file into message parts and media basenames.
+
+    Accepts an export .zip, a gzip'd message JSON or a plain .json file;
+    the format is sniffed from the first bytes. Anything else yields no
+    parts. Sizes are uncompressed where the archive records them.
+    """
+    stream.seek(0)
+    head = _magic(stream, 4)
+    if head.startswith(_ZIP_MAGIC):
+        return zip_parts(stream, thread)
+    if head.startswith(_GZIP_MAGIC):
+        return [{"filename": filename, "stream": gzip.GzipFile(fileobj=stream, mode='rb'), "size": _gzip_size(stream)}], {}
+    if filename.endswith('.json'):
+        return [{"filename": filename, "stream": stream, "size": _stream_size(stream)}], {}
+    return [], {}
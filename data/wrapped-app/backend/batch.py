@@ -0,0 +1,178 @@
+"""
+Analyse many exported chats from the command line, without the HTTP server.
+
+    python batch.py EXPORT_DIR_OR_ZIP [...] --out results --workers 8
+
+Every conversation found is analysed in its own worker process: each
+directory holding message_N.json files (at any depth) and each thread in an
+export .zip. Parts are streamed from disk. A chat's results are written to
+OUT/<thread>/ as stats.json, rankings.json, network_data.json,
+chart_data.json, media_files.json and share_options.json; the directory is
+swapped in whole, so readers never see a half-written set.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+
+from archives import zip_parts, zip_threads
+from process_data import process_uploaded_data
+from timings import Timings
+
+_MESSAGE_FILE_RE = re.compile(r'^message_(\d+)\.json$')
+
+# Output name of a chat whose directory has no name of its own (the filesystem root)
+_FALLBACK_NAME = 'chat'
+
+
+def _dir_name(path):
+    # Resolved first, so '.', '..' and trailing separators name the real directory
+    return os.path.basename(os.path.normpath(os.path.abspath(path))) or _FALLBACK_NAME
+
+
+def find_chats(paths):
+    """
+    Chats under the given export directories and zips, as dicts with a
+    'name' and either a 'dir' or a 'zip' and 'thread'.
+    """
+    chats = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                if any(_MESSAGE_FILE_RE.match(f) for f in filenames):
+                    chats.append({"name": _dir_name(dirpath), "dir": dirpath})
+        elif zipfile.is_zipfile(path):
+            with open(path, 'rb') as f:
+                for thread in zip_threads(f):
+                    chats.append({"name": thread, "zip": path, "thread": thread})
+        else:
+            print(f"Skipping {path}: not an export directory or zip", file=sys.stderr)
+
+    # Output directory names: unique, and never hidden or a parent reference
+    seen = {}
+    for chat in chats:
+        name = chat["name"] if not chat["name"].startswith('.') else f"chat{chat['name']}"
+        seen[name] = seen.get(name, 0) + 1
+        chat["name"] = name if seen[name] == 1 else f"{name}-{seen[name]}"
+    return chats
+
+
+def _parts(chat, stack):
+    if "dir" in chat:
+        names = [f for f in os.listdir(chat["dir"]) if _MESSAGE_FILE_RE.match(f)]
+        names.sort(key=lambda f: int(_MESSAGE_FILE_RE.match(f).group(1)))
+        return [{"filename": f, "path": os.path.join(chat["dir"], f)} for f in names]
+    f = stack.enter_context(open(chat["zip"], 'rb'))
+    parts, _ = zip_parts(f, chat["thread"])
+    return parts
+
+
+def result_files(results):
+    """{filename: JSON-able value} written for one chat's results."""
+    files = {f"{key}.json": value for key, value in results.items()
+             if key not in ('media_files', 'share_story_options') and not key.startswith('_')}
+    files["media_files.json"] = {"media_files": results.get("media_files", [])}
+    files["share_options.json"] = {"share_story_options": results.get("share_story_options", [])}
+    return files
+
+
+def write_results(results, target):
+    """Write the result files into target, replacing any earlier set at once."""
+    parent = os.path.dirname(os.path.abspath(target))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        for name, value in result_files(results).items():
+            with open(os.path.join(tmp, name), 'w', encoding='utf-8') as f:
+                json.dump(value, f, indent=2, ensure_ascii=False)
+        old = None
+        if os.path.exists(target):
+            old = tempfile.mkdtemp(dir=parent, prefix='.old-')
+            os.rename(target, os.path.join(old, 'results'))
+        os.rename(tmp, target)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def analyse_chat(chat, out_dir, locale=None, seed=None):
+    """Analyse one chat and write its results; returns a summary dict."""
+    start = time.perf_counter()
+    timings = Timings()
+    with ExitStack() as stack:
+        parts = _parts(chat, stack)
+        results = process_uploaded_data(parts, workers=0, locale=locale, seed=seed, timings=timings)
+    results.pop("_chat", None)
+    target = os.path.join(out_dir, chat["name"])
+    write_results(results, target)
+    return {
+        "name": chat["name"],
+        "out": target,
+        "parts": len(parts),
+        "messages": timings.counters.get("messages", 0),
+        "errors": timings.counters.get("errors", 0),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run(chats, out_dir, workers, locale=None, seed=None):
+    """Analyse chats on a pool of worker processes; yields (chat, summary or exception)."""
+    if workers <= 1:
+        for chat in chats:
+            try:
+                yield chat, analyse_chat(chat, out_dir, locale, seed)
+            except Exception as e:
+                yield chat, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyse_chat, chat, out_dir, locale, seed): chat for chat in chats}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse exported chats and write their result files.")
+    parser.add_argument('paths', nargs='+', help="export directories (searched recursively) or export .zip files")
+    parser.add_argument('--out', default='results', help="directory to write one sub-directory of results per chat into")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="chats analysed at once; 1 runs in this process")
+    parser.add_argument('--locale', help="lexicon locale (see WRAPPED_LOCALE)")
+    parser.add_argument('--seed', type=int, help="seed for reproducible quiz sampling")
+    parser.add_argument('--skip-existing', action='store_true', help="leave chats that already have results alone")
+    args = parser.parse_args()
+
+    chats = find_chats(args.paths)
+    if args.skip_existing:
+        chats = [chat for chat in chats if not os.path.isdir(os.path.join(args.out, chat["name"]))]
+    if not chats:
+        print("No chats to analyse.", file=sys.stderr)
+        return
+
+    failed = 0
+    start = time.perf_counter()
+    for i, (chat, outcome) in enumerate(run(chats, args.out, args.workers, args.locale, args.seed), 1):
+        if isinstance(outcome, Exception):
+            failed += 1
+            print(f"[{i}/{len(chats)}] {chat['name']}: failed: {outcome}", file=sys.stderr)
+        else:
+            errors = f", {outcome['errors']} unreadable part(s)" if outcome['errors'] else ""
+            print(f"[{i}/{len(chats)}] {chat['name']}: {outcome['messages']} messages in {outcome['seconds']}s{errors}", file=sys.stderr)
+    print(f"Analysed {len(chats) - failed} of {len(chats)} chats in {time.perf_counter() - start:.1f}s into {args.out}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
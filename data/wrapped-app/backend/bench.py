@@ -0,0 +1,204 @@
+"""
+Throughput benchmark for process_uploaded_data on synthetic exports.
+
+    python bench.py --sizes 10000,100000,1000000 --out bench.json
+    python bench.py --sizes 100000 --compare bench.json
+
+Each size runs in a fresh interpreter so peak RSS belongs to that run alone.
+Results are JSON: messages/sec, wall and CPU time, peak RSS and per-phase
+timings (parse, tokenize, analyse, timeline, network, finalize). --compare
+exits non-zero when throughput drops more than --tolerance below a saved run.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.environ.get('WRAPPED_BENCH_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bench'))
+
+
+def _timed(fn):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = fn()
+    return result, {"wall_s": round(time.perf_counter() - wall, 4), "cpu_s": round(time.process_time() - cpu, 4)}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure(paths, workers):
+    """Run one analysis over paths and time its phases; called in a child process."""
+    # The part cache would turn repeat runs into cache reads
+    os.environ['WRAPPED_CACHE_MAX_BYTES'] = '0'
+    from process_data import analyse_parts, iter_messages
+    from lexicon import get_lexicon
+    from network import build_network_data
+    from text_utils import fix_text
+
+    files = [{"path": p} for p in paths]
+    phases = {}
+
+    # The real pipeline first, so peak RSS reflects it and not the probes below
+    chat, phases["analyse"] = _timed(lambda: analyse_parts(files, workers))
+    _, phases["timeline"] = _timed(chat.timeline.finalize)
+    participants = sorted(chat.messages_sent.counts)
+    _, phases["network"] = _timed(lambda: build_network_data(participants, chat.reactions.matrix, chat.reactions.given))
+    results, phases["finalize"] = _timed(chat.finalize)
+    peak_rss = _peak_rss_mb()
+
+    def parse():
+        return sum(1 for p in files for _ in iter_messages(p))
+
+    def parse_and_tokenize():
+        lexicon = get_lexicon()
+        for p in files:
+            for message in iter_messages(p):
+                content = message.get('content')
+                if content:
+                    lexicon.tokenize(lexicon.expand_contractions(fix_text(content)))
+
+    messages, phases["parse"] = _timed(parse)
+    _, both = _timed(parse_and_tokenize)
+    # Tokenizing can't be timed without parsing, so report the difference
+    phases["tokenize"] = {k: round(max(0.0, both[k] - phases["parse"][k]), 4) for k in both}
+
+    # The timeline pass runs once, before finalize (which reuses its result);
+    # the network probe is rebuilt inside finalize, so it isn't added again
+    counted = ("analyse", "timeline", "finalize")
+    total_wall = sum(phases[p]["wall_s"] for p in counted)
+    total_cpu = sum(phases[p]["cpu_s"] for p in counted)
+    return {
+        "messages": messages,
+        "files": len(paths),
+        "bytes": sum(os.path.getsize(p) for p in paths),
+        "wall_s": round(total_wall, 4),
+        "cpu_s": round(total_cpu, 4),
+        "msgs_per_sec": round(messages / total_wall) if total_wall else None,
+        "peak_rss_mb": peak_rss,
+        "participants": len(participants),
+        "links": len(results["network_data"]["links"]),
+        "phases": phases,
+    }
+
+
+def _export_for(size, args):
+    # Generated exports are reused across runs with the same parameters
+    from synth_export import generate_export
+    name = f"n{size}_p{args.participants}_r{args.reaction_density}_m{args.media_ratio}_j{args.mojibake_rate}_s{args.seed}"
+    out_dir = os.path.join(BENCH_DIR, name)
+    done = os.path.join(out_dir, '.complete')
+    if not os.path.exists(done):
+        print(f"Generating {size} messages into {out_dir}", file=sys.stderr)
+        generate_export(out_dir, size, args.participants, args.reaction_density, args.media_ratio, args.mojibake_rate, seed=args.seed)
+        open(done, 'w').close()
+    return sorted((os.path.join(out_dir, f) for f in os.listdir(out_dir) if f.endswith('.json')),
+                  key=lambda p: int(os.path.basename(p)[8:-5]))
+
+
+def run(args):
+    runs = []
+    for size in args.sizes:
+        paths = _export_for(size, args)
+        for repeat in range(args.repeat):
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--measure', '--workers', str(args.workers), *paths],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+            )
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            result.update({"size": size, "repeat": repeat})
+            print(f"{size:>9} msgs  {result['msgs_per_sec']:>9} msg/s  {result['wall_s']:>8.2f}s  {result['peak_rss_mb']:>8.1f} MB", file=sys.stderr)
+            runs.append(result)
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    try:
+        import ijson
+        ijson_backend = ijson.backend
+    except ImportError:
+        ijson_backend = None
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": numpy_version,
+            "ijson_backend": ijson_backend,
+            "workers": args.workers,
+            "participants": args.participants,
+            "reaction_density": args.reaction_density,
+            "media_ratio": args.media_ratio,
+            "mojibake_rate": args.mojibake_rate,
+            "seed": args.seed,
+            "timestamp": int(time.time()),
+        },
+        "runs": runs,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Sizes whose best msgs/sec fell more than tolerance below the baseline's."""
+    def best(runs):
+        by_size = {}
+        for r in runs:
+            by_size[r["size"]] = max(by_size.get(r["size"], 0), r["msgs_per_sec"] or 0)
+        return by_size
+
+    now, before = best(report["runs"]), best(baseline["runs"])
+    regressions = []
+    for size, rate in now.items():
+        if size in before and rate < before[size] * (1 - tolerance):
+            regressions.append({"size": size, "msgs_per_sec": rate, "baseline": before[size]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark process_uploaded_data on synthetic exports.")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="comma-separated message counts (e.g. up to 5000000)")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=0, help="analysis worker processes (see WRAPPED_ANALYSIS_WORKERS)")
+    parser.add_argument('--participants', type=int, default=12)
+    parser.add_argument('--reaction-density', type=float, default=0.4)
+    parser.add_argument('--media-ratio', type=float, default=0.05)
+    parser.add_argument('--mojibake-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="earlier JSON report to check throughput against")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed msgs/sec drop for --compare")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.paths, args.workers)))
+        return
+
+    args.sizes = [int(s) for s in args.sizes.split(',') if s]
+    report = run(args)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if report.get("regressions"):
+        for r in report["regressions"]:
+            print(f"Regression at {r['size']} messages: {r['msgs_per_sec']} msg/s vs {r['baseline']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
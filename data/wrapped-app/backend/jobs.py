@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Analyses run at once, off the event loop; further jobs queue behind them
+JOB_WORKERS = int(os.environ.get('WRAPPED_JOB_WORKERS', '2'))
+# Seconds a finished job's result is kept for polling
+JOB_TTL = int(os.environ.get('WRAPPED_JOB_TTL', '3600'))
+
+
+class Job:
+    """One background analysis and how far along it is."""
+
+    def __init__(self, job_id, files_total):
+        self.id = job_id
+        self.status = 'queued'
+        self.files_total = files_total
+        self.files_parsed = 0
+        self.messages_processed = 0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def progress(self, files=0, messages=0):
+        # Called from the worker thread by analyse_parts
+        with self._lock:
+            self.files_parsed += files
+            self.messages_processed += messages
+
+    def snapshot(self):
+        with self._lock:
+            job = {
+                "job_id": self.id,
+                "status": self.status,
+                "progress": {
+                    "files_total": self.files_total,
+                    "files_parsed": self.files_parsed,
+                    "messages_processed": self.messages_processed,
+                },
+            }
+            if self.status == 'done':
+                job["result"] = self.result
+            elif self.status == 'failed':
+                job["error"] = self.error
+        return job
+
+
+class JobStore:
+    """
+    In-memory registry of background analyses, run on a bounded thread pool.
+
+    Jobs live in the memory of the process that accepted them, so with
+    several server processes a job has to be polled on the one that created
+    it. Finished jobs are dropped JOB_TTL seconds after they complete.
+    """
+
+    def __init__(self, workers, ttl):
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='analysis')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, files_total, cleanup=None):
+        """
+        Queue fn(job) and return the Job straight away. fn's return value
+        becomes the job's result; cleanup() runs once the job has finished.
+        """
+        job = Job(uuid.uuid4().hex, files_total)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, cleanup)
+        return job
+
+    def _run(self, job, fn, cleanup):
+        job.status = 'running'
+        try:
+            result = fn(job)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            with job._lock:
+                job.error = str(e)
+                job.status = 'failed'
+        else:
+            with job._lock:
+                job.result = result
+                job.status = 'done'
+        finally:
+            job.finished = time.time()
+            if cleanup is not None:
+                cleanup()
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+_default_store = None
+
+
+def get_job_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = JobStore(JOB_WORKERS, JOB_TTL)
+    return _default_store
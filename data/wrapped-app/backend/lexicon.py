@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import re
+from types import MappingProxyType
+
+
+STOPWORDS = frozenset({
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd",
+    'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers',
+    'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
+    'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been',
+    'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if',
+    'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between',
+    'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out',
+    'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why',
+    'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not',
+    'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should',
+    "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't",
+    'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't",
+    'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't",
+    'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't", 'like', 'get', 'got', 'know',
+    'think', 'going', 'really', 'yeah', 'lol', 'lmao', 'good', 'well', 'much', 'see', 'want', 'one', 'even',
+    'message', 'liked', 'im', 'guys', 'sent', 'attachment', 'dont', 'ur', 'thats',
+    'yeah', 'yes', 'no', 'ok', 'okay', 'like', 'get', 'got', 'know', 'think', 'going',
+    'really', 'good', 'well', 'much', 'see', 'want', 'one', 'even', 'right', 'mean',
+    'thing', 'things', 'still', 'actually', 'probably', 'maybe', 'sure', 'back',
+    'come', 'take', 'look', 'want', 'gonna', 'wanna', 'gotta', 'lol', 'lmao', 'lmfao',
+    'haha', 'hahaha', 'ah', 'oh', 'hey', 'hi', 'hello'
+})
+
+# Small mapping to expand common contractions so we don't end up with tokens like "thats"
+CONTRACTIONS_MAP = {
+    "ain't": "is not",
+    "aren't": "are not",
+    "can't": "cannot",
+    "can't've": "cannot have",
+    "could've": "could have",
+    "couldn't": "could not",
+    "couldn't've": "could not have",
+    "didn't": "did not",
+    "doesn't": "does not",
+    "don't": "do not",
+    "hadn't": "had not",
+    "hadn't've": "had not have",
+    "hasn't": "has not",
+    "haven't": "have not",
+    "he'd": "he would",
+    "he'd've": "he would have",
+    "he'll": "he will",
+    "he's": "he is",
+    "i'd": "i would",
+    "i'd've": "i would have",
+    "i'll": "i will",
+    "i'm": "i am",
+    "i've": "i have",
+    "isn't": "is not",
+    "it's": "it is",
+    "let's": "let us",
+    "mightn't": "might not",
+    "mustn't": "must not",
+    "shan't": "shall not",
+    "she's": "she is",
+    "should've": "should have",
+    "shouldn't": "should not",
+    "that's": "that is",
+    "there's": "there is",
+    "they're": "they are",
+    "they've": "they have",
+    "we're": "we are",
+    "we've": "we have",
+    "weren't": "were not",
+    "what's": "what is",
+    "won't": "will not",
+    "wouldn't": "would not",
+    "you'd": "you would",
+    "you'll": "you will",
+    "you're": "you are",
+    # Add defensive lowercase variants without apostrophes commonly produced by earlier cleaning
+    'thats': 'that is',
+    'dont': 'do not',
+    'im': 'i am',
+    'ive': 'i have',
+    'cant': 'cannot',
+    'its': 'it is'
+}
+
+# Word stems counted as profanity; each letter may repeat ("fuuuck")
+PROFANITY_STEMS = ('fuck', 'shit', 'bitch', 'damn', 'ass', 'hell')
+
+# Pronouns/determiners the word counts skip on top of the stopwords
+_FILTERED_PRONOUNS = frozenset({'that', 'this', 'these', 'those', 'they', 'them', 'their', 'there'})
+
+# ASCII characters outside \w: deleted (word counts) or stripped from the
+# ends (longest word) with str.translate / str.strip on the fast path
+_ASCII_NON_WORD = ''.join(c for c in map(chr, range(128)) if not (c.isalnum() or c == '_'))
+_DROP_ASCII_NON_WORD = str.maketrans('', '', _ASCII_NON_WORD)
+# Same operations for words with non-ASCII characters
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_EDGE_NON_WORD_RE = re.compile(r'^[^\w]+|[^\w]+$')
+_URL_PREFIXES = ('http', 'www')
+
+
+def _profanity_pattern(stems):
+    # Combined profanity pattern for faster matching
+    alternatives = '|'.join(''.join(f'[{c.lower()}{c.upper()}]+' for c in stem) for stem in stems)
+    return re.compile(r'\b(' + alternatives + r')[a-zA-Z]*\b')
+
+
+class Lexicon:
+    """
+    Immutable word lists and compiled patterns used to tokenize messages.
+
+    Built once per process and shared by every analysis; use get_lexicon() to
+    look one up by locale and register_lexicon() (or WRAPPED_LEXICON_FILE) to
+    plug in custom stopword, contraction and profanity lists.
+    """
+    __slots__ = ('locale', 'stopwords', 'contractions', 'profanity_stems', 'fingerprint',
+                 '_profanity_re', '_profanity_initials', '_contractions_re')
+
+    def __init__(self, locale, stopwords, contractions, profanity_stems):
+        self.locale = locale
+        self.stopwords = frozenset(stopwords)
+        self.contractions = MappingProxyType(dict(contractions))
+        self.profanity_stems = tuple(profanity_stems)
+        self._profanity_re = _profanity_pattern(self.profanity_stems)
+        # Cheap pre-check before running the profanity pattern
+        self._profanity_initials = frozenset(c for stem in self.profanity_stems for c in (stem[0].lower(), stem[0].upper()))
+        # Pre-compile contractions regex for speed
+        self._contractions_re = re.compile(r'\b(' + '|'.join(re.escape(key) for key in self.contractions.keys()) + r')\b', re.IGNORECASE)
+        # Identifies the lists in cache keys, so results from another lexicon are never reused
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [locale, sorted(self.stopwords), sorted(self.contractions.items()), self.profanity_stems]
+        ).encode('utf-8')).hexdigest()[:16]
+
+    def __reduce__(self):
+        return (Lexicon, (self.locale, self.stopwords, dict(self.contractions), self.profanity_stems))
+
+    def with_overrides(self, locale=None, stopwords=None, extra_stopwords=(), contractions=None, profanity_stems=None):
+        """A copy with some of the lists replaced or extended."""
+        return Lexicon(
+            locale or self.locale,
+            (self.stopwords if stopwords is None else frozenset(stopwords)) | frozenset(extra_stopwords),
+            self.contractions if contractions is None else contractions,
+            self.profanity_stems if profanity_stems is None else profanity_stems,
+        )
+
+    def expand_contractions(self, text):
+        if not isinstance(text, str) or not text:
+            return text
+        # Normalize simple unicode apostrophes
+        t = text.replace('\u2019', "'").replace('\u2018', "'")
+        contractions = self.contractions
+        return self._contractions_re.sub(lambda m: contractions.get(m.group(0).lower(), m.group(0)), t.lower())
+
+    def tokenize(self, text):
+        """
+        Single pass over the words of lowercased, contraction-expanded text.
+
+        Returns (tokens, profanity_hits, longest_word): the stopword-filtered,
+        purely alphabetic words for the word counts, the number of profane
+        words, and the first longest word whose punctuation-stripped form is
+        purely alphabetic. URLs are skipped entirely.
+        """
+        stopwords = self.stopwords
+        profanity_re = self._profanity_re
+        profanity_initials = self._profanity_initials
+        tokens = []
+        profanity_hits = 0
+        longest = ''
+        for w in text.split():
+            if w.startswith(_URL_PREFIXES) or '://' in w:
+                continue
+
+            if w[0] in profanity_initials and profanity_re.match(w):
+                profanity_hits += 1
+
+            if w.isascii():
+                cleaned = w.translate(_DROP_ASCII_NON_WORD)
+                core = w.strip(_ASCII_NON_WORD)
+            else:
+                cleaned = _NON_WORD_RE.sub('', w)
+                core = _EDGE_NON_WORD_RE.sub('', w)
+
+            if (len(cleaned) > 2 and cleaned.isascii() and cleaned.isalpha()
+                    and cleaned not in stopwords and cleaned not in _FILTERED_PRONOUNS):
+                tokens.append(cleaned)
+
+            # Strict check: Must be purely English letters to avoid emojis/symbols/mojibake
+            if len(core) > len(longest) and core.isascii() and core.isalpha():
+                longest = core
+        return tokens, profanity_hits, longest
+
+
+ENGLISH = Lexicon('en', STOPWORDS, CONTRACTIONS_MAP, PROFANITY_STEMS)
+
+_LEXICONS = {ENGLISH.locale: ENGLISH}
+
+# Locale used when a request doesn't ask for one
+DEFAULT_LOCALE = os.environ.get('WRAPPED_LOCALE', 'en')
+
+
+def register_lexicon(lexicon):
+    _LEXICONS[lexicon.locale] = lexicon
+    return lexicon
+
+
+def get_lexicon(locale=None):
+    locale = locale or DEFAULT_LOCALE
+    try:
+        return _LEXICONS[locale]
+    except KeyError:
+        raise ValueError(f"Unknown lexicon locale: {locale}")
+
+
+def load_lexicon_file(path):
+    """
+    Register a lexicon described by a JSON file:
+    {"locale": "en-custom", "base": "en", "stopwords": [...], "extra_stopwords": [...],
+     "contractions": {...}, "profanity": [...]}
+    Missing lists are taken from the base lexicon.
+    """
+    with open(path, encoding='utf-8') as f:
+        spec = json.load(f)
+    base = get_lexicon(spec.get('base', 'en'))
+    return register_lexicon(base.with_overrides(
+        locale=spec.get('locale'),
+        stopwords=spec.get('stopwords'),
+        extra_stopwords=spec.get('extra_stopwords', ()),
+        contractions=spec.get('contractions'),
+        profanity_stems=spec.get('profanity'),
+    ))
+
+
+# Custom lists can be plugged in per deployment; every worker process loads them on import
+if os.environ.get('WRAPPED_LEXICON_FILE'):
+    load_lexicon_file(os.environ['WRAPPED_LEXICON_FILE'])
@@ -1,8 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from typing import List, Optional
+import asyncio
 import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
 from process_data import process_uploaded_data
+from part_cache import get_part_cache, part_key
+from sessions import get_session_store
+from lexicon import get_lexicon
+from jobs import get_job_store
+from admission import AdmissionError, get_admission
+from archives import upload_media, upload_parts
+from share_story import STORY_MAX_SIDE, available_formats, generate_share_story
+from stories import STORY_MEDIA_TYPES, get_story_store, stage_media
+from payloads import columnar, etag_matches, input_etag, negotiate, results_response
+from timings import Timings
+from profiling import PROFILE_UPLOADS, NoCache, get_profiler, is_admin
+import metrics
 
 app = FastAPI()
 
@@ -15,30 +34,383 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
+def _upload_parts(files, thread=None):
+    # Hand the spooled upload files straight to the analysis so each part is
+    # parsed incrementally instead of being read and decoded up front. Export
+    # zips and gzip'd JSON are read in place, without extracting them.
     files_data = []
+    media = {}
     for file in files:
-        if not file.filename.endswith('.json'):
-            continue
-        content = await file.read()
         try:
-            files_data.append({
-                "filename": file.filename,
-                "content": content.decode('utf-8')
-            })
-        except Exception as e:
-            print(f"Error reading {file.filename}: {e}")
-            continue
+            parts, found = upload_parts(file.filename, file.file, thread)
+        except (ValueError, zipfile.BadZipFile, OSError) as e:
+            raise HTTPException(status_code=400, detail=f"{file.filename}: {e}")
+        files_data.extend(parts)
+        media.update(found)
     
     if not files_data:
         raise HTTPException(status_code=400, detail="No valid JSON files uploaded.")
-    
+    return files_data, media
+
+@app.middleware("http")
+async def reject_oversized_bodies(request: Request, call_next):
+    # Turn away bodies that could never be admitted before they are spooled
+    length = request.headers.get("content-length")
+    if request.method == "POST" and length and length.isdigit() and int(length) > get_admission().max_bytes:
+        return JSONResponse(status_code=413, content={"detail": "Upload too large."})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Latency and in-flight requests, labelled by route template rather
+    # than raw path so session/job/story IDs don't each get a series
+    start = time.perf_counter()
+    metrics.requests_in_flight.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.requests_in_flight.dec()
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.request_seconds.observe(time.perf_counter() - start, method=request.method, path=path)
+        metrics.requests_total.inc(method=request.method, path=path, status=status)
+
+def _admit(sizes):
+    # Take an analysis slot for uploads of these sizes or answer 413/429
+    # straight away; returns the callable that gives the slot back
+    try:
+        return get_admission().admit(sizes)
+    except AdmissionError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+def _spool_parts(parts, job_dir):
+    # Upload files are closed once the request returns, so a background job
+    # gets its own copies on disk and parses them from there
+    files_data = []
+    for i, part in enumerate(parts):
+        path = os.path.join(job_dir, f"part_{i}.json")
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(part["stream"], f)
+        files_data.append({"filename": part["filename"], "path": path})
+    return files_data
+
+def _resolve_locale(locale):
+    try:
+        return get_lexicon(locale).locale
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _with_archive_media(results, media):
+    # Which of the chat's media files came with the uploaded export archive
+    if media:
+        results["media_in_archive"] = [b for b in results.get("media_files", []) if b in media]
+    return results
+
+def _timed_analysis(kind, with_timings, fn, *args, **kwargs):
+    # Every analysis feeds /metrics; with_timings also puts its per-phase
+    # times and counters into the results
+    timings = Timings()
+    start = time.perf_counter()
+    results = fn(*args, timings=timings, **kwargs)
+    metrics.record_analysis(timings, kind, time.perf_counter() - start)
+    if with_timings:
+        results["timings"] = timings.as_dict()
+    return results
+
+def _profiled_analysis(files_data, **kwargs):
+    # In this thread and without the part cache, so the profile covers
+    # parsing and aggregating every part
+    label = ", ".join(part.get("filename") or "?" for part in files_data)
+    results, report_id = get_profiler().run(label, process_uploaded_data, files_data, workers=0, cache=NoCache(), **kwargs)
+    results["profile_id"] = report_id
+    return results
+
+def _analyse(files_data, locale, media=None, progress=None, with_timings=False, profile=False):
+    fn = _profiled_analysis if profile else process_uploaded_data
+    results = _timed_analysis("upload", with_timings, fn, files_data, locale=locale, progress=progress)
+    # Snapshot the merged aggregates so later messages can be appended
+    results["session_id"] = get_session_store().create(results.pop("_chat"))
+    return _with_archive_media(results, media)
+
+def _append(session_id, files_data, media=None, with_timings=False):
+    store = get_session_store()
+    with store.locked(session_id):
+        chat = store.load(session_id)
+        if chat is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired session.")
+        try:
+            results = _timed_analysis("append", with_timings, process_uploaded_data, files_data, base=chat)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        store.save(session_id, results.pop("_chat"))
+    results["session_id"] = session_id
+    return _with_archive_media(results, media)
+
+def _released(release, fn, *args):
+    # The slot is held until the analysis itself ends, even if the client left
+    try:
+        return fn(*args)
+    finally:
+        release()
+
+async def _in_pool(release, fn, *args):
+    # Run blocking analysis on the bounded job pool so the event loop stays free
+    try:
+        future = get_job_store().executor.submit(_released, release, fn, *args)
+    except BaseException:
+        release()
+        raise
+    return await asyncio.wrap_future(future)
+
+def _negotiate(request):
     try:
-        results = process_uploaded_data(files_data)
-        return results
+        return negotiate(request)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+def _wants_profile(request):
+    # Admins can profile an upload with X-Wrapped-Profile: 1, or all of
+    # their uploads with WRAPPED_PROFILE_UPLOADS; anyone else asking is refused
+    asked = request.headers.get("x-wrapped-profile", "") not in ("", "0")
+    if not asked and not PROFILE_UPLOADS:
+        return False
+    if is_admin(request.headers.get("x-admin-token")):
+        return True
+    if asked:
+        raise HTTPException(status_code=403, detail="Profiling is restricted to admins.")
+    return False
+
+def _upload_etag(files_data, media, locale, *variant):
+    # Hash the parts up front so an unchanged upload can be answered with a
+    # 304 before any analysis; analyse_parts reuses the keys. The archive's
+    # media names go in too, since they decide media_in_archive.
+    fingerprint = get_lexicon(locale).fingerprint
+    for part in files_data:
+        part["key"] = part_key(part, fingerprint)
+    return input_etag([part["key"] for part in files_data], locale, tuple(sorted(media)), *variant)
+
+@app.post("/upload")
+async def upload_files(request: Request, files: List[UploadFile] = File(...), locale: Optional[str] = None, thread: Optional[str] = None,
+                       timings: bool = False):
+    # thread picks the conversation when an uploaded export zip holds several;
+    # timings=1 adds per-phase times and counters to the results
+    files_data, media = _upload_parts(files, thread)
+    locale = _resolve_locale(locale)
+    fmt, layout, coding = _negotiate(request)
+    profile = _wants_profile(request)
+    # Hashing for the ETag reads (and decompresses) every part, so it runs
+    # under the same admission slot and job pool as the analysis
+    release = _admit([part["size"] for part in files_data])
+    etag = None
+    if not timings and not profile:
+        # Timings and profiles differ run to run, so such responses get no ETag.
+        # A 304 leaves the client with the session_id it cached; that session
+        # may have expired since, in which case appends to it get a 404 and
+        # the client has to upload again without If-None-Match.
+        try:
+            etag = await asyncio.wrap_future(
+                get_job_store().executor.submit(_upload_etag, files_data, media, locale, fmt, layout, coding))
+        except BaseException:
+            release()
+            raise
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            release()
+            return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        results = await _in_pool(release, _analyse, files_data, locale, media, None, timings, profile)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    response = results_response(results, fmt, layout, coding, etag)
+    if profile:
+        response.headers["X-Profile-Id"] = results["profile_id"]
+    return response
+
+@app.post("/sessions/{session_id}/append")
+async def append_files(request: Request, session_id: str, files: List[UploadFile] = File(...), thread: Optional[str] = None,
+                       timings: bool = False):
+    # Fold only the new message files into an earlier upload's aggregates
+    files_data, media = _upload_parts(files, thread)
+    fmt, layout, coding = _negotiate(request)
+    release = _admit([part["size"] for part in files_data])
+    results = await _in_pool(release, _append, session_id, files_data, media, timings)
+    return results_response(results, fmt, layout, coding)
+
+@app.post("/jobs", status_code=202)
+async def create_job(files: List[UploadFile] = File(...), locale: Optional[str] = None, thread: Optional[str] = None,
+                     timings: bool = False):
+    # Same analysis as /upload, but returns at once; poll GET /jobs/{job_id}
+    locale = _resolve_locale(locale)
+    parts, media = _upload_parts(files, thread)
+    release = _admit([part["size"] for part in parts])
+    job_dir = tempfile.mkdtemp(prefix='wrapped-job-')
+
+    def cleanup():
+        shutil.rmtree(job_dir, ignore_errors=True)
+        release()
+
+    try:
+        files_data = _spool_parts(parts, job_dir)
+        job = get_job_store().submit(
+            lambda job: _analyse(files_data, locale, media, progress=job.progress, with_timings=timings),
+            files_total=len(files_data),
+            cleanup=cleanup,
+        )
+    except BaseException:
+        cleanup()
+        raise
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    # Progress while queued/running, then the same payload /upload returns
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    snapshot = job.snapshot()
+    if "result" not in snapshot:
+        return snapshot
+    fmt, layout, coding = _negotiate(request)
+    if layout == 'columnar':
+        snapshot["result"] = columnar(snapshot["result"])
+    return results_response(snapshot, fmt, coding=coding)
+
+def _story_formats(formats):
+    available = available_formats()
+    if not formats:
+        return available
+    wanted = [fmt.strip() for fmt in formats.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in wanted if fmt not in available]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"Unsupported story format(s): {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return wanted
+
+def _story_urls(story_id, formats):
+    return {fmt: f"/story/{story_id}.{fmt}" for fmt in formats}
+
+@app.post("/story", status_code=202)
+async def create_story(response: Response, files: List[UploadFile] = File(...), media_files: Optional[List[str]] = Form(None),
+                       formats: Optional[str] = None, thread: Optional[str] = None):
+    # Build share-story decks from an export zip (or the image files
+    # themselves) in the background. media_files, e.g. the analysis'
+    # media_files, picks and orders the images; decks are cached per media
+    # set, so asking again for the same story generates nothing. jobs maps
+    # each missing format to the job building it, which may belong to an
+    # earlier request for the same story.
+    wanted = _story_formats(formats)
+    openers = {}
+    for file in files:
+        try:
+            openers.update(upload_media(file.filename, file.file, thread))
+        except (ValueError, zipfile.BadZipFile, OSError) as e:
+            raise HTTPException(status_code=400, detail=f"{file.filename}: {e}")
+    sizes = []
+    for file in files:
+        # Plain image uploads are staged from the stream itself, so rewind it
+        file.file.seek(0, os.SEEK_END)
+        sizes.append(file.file.tell())
+        file.file.seek(0)
+    release = _admit(sizes)
+
+    store = get_story_store()
+    workdir = store.workdir()
+    media_dir = os.path.join(workdir, 'media')
+    os.makedirs(media_dir)
+    # Formats this request claimed and builds itself
+    owned = []
+
+    def cleanup():
+        shutil.rmtree(workdir, ignore_errors=True)
+        release()
+        if owned:
+            store.release(story_id, owned)
+
+    try:
+        story_id, staged, digests = await asyncio.wrap_future(
+            get_job_store().executor.submit(stage_media, openers, media_files, media_dir, STORY_MAX_SIDE))
+        if not staged:
+            raise HTTPException(status_code=400, detail="None of the requested media files were uploaded.")
+        missing = store.missing(story_id, wanted)
+        if not missing:
+            cleanup()
+            response.status_code = 200
+            return {"story_id": story_id, "status": "done", "urls": _story_urls(story_id, wanted)}
+
+        def build(job):
+            artifacts = generate_share_story(media_dir, staged, os.path.join(workdir, 'out'), methods=owned,
+                                             digests=digests, persist_index=False)
+            store.publish(story_id, artifacts)
+            job.progress(files=len(staged))
+            ready = [fmt for fmt in wanted if fmt not in missing or fmt in artifacts]
+            return {"story_id": story_id, "urls": _story_urls(story_id, ready), "failed": [fmt for fmt in owned if fmt not in artifacts]}
+
+        def start(formats):
+            owned.extend(formats)
+            try:
+                return get_job_store().submit(build, files_total=len(staged), cleanup=cleanup).id
+            except BaseException:
+                owned.clear()
+                raise
+
+        jobs = store.claim(story_id, missing, start)
+    except BaseException:
+        if not owned:
+            cleanup()
+        raise
+    if not owned:
+        # Other requests are already building every missing format
+        cleanup()
+    job_id = jobs[owned[0]] if owned else jobs[missing[0]]
+    return {"story_id": story_id, "job_id": job_id, "jobs": jobs, "status": "queued", "urls": _story_urls(story_id, wanted)}
+
+@app.get("/story/{story_file}")
+async def get_story(story_file: str):
+    # Generated decks are immutable per story ID; FileResponse handles Range requests
+    story_id, _, fmt = story_file.partition('.')
+    path = get_story_store().get(story_id, fmt)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Story not generated (yet).")
+    return FileResponse(
+        path,
+        media_type=STORY_MEDIA_TYPES[fmt],
+        filename=f"story_deck.{fmt}",
+        content_disposition_type="inline" if fmt == 'html' else "attachment",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+@app.get("/cache")
+async def cache_stats():
+    # Hit/miss counters and disk usage of the per-part result cache
+    cache = get_part_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/admission")
+async def admission_stats():
+    # Running/queued analyses and upload bytes they hold
+    return get_admission().stats()
+
+@app.get("/profiles/{report_id}")
+async def get_profile(request: Request, report_id: str):
+    # Top functions and allocation sites of a profiled upload
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Profiling is restricted to admins.")
+    report = get_profiler().get(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Unknown profile report.")
+    return PlainTextResponse(report)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text format: request latency, in-flight requests and
+    # analyses, per-phase analysis time and messages/words/bytes processed
+    metrics.record_admission(get_admission().stats())
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
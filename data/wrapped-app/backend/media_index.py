@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Where basename -> path indexes of media roots are kept between runs
+INDEX_DIR = os.environ.get('WRAPPED_MEDIA_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'media_index'))
+
+# Media roots whose indexes are kept, in memory and on disk; least recently
+# used ones are dropped beyond this
+INDEX_MAX_ROOTS = int(os.environ.get('WRAPPED_MEDIA_INDEX_MAX_ROOTS', '32'))
+
+_INDEX_VERSION = 1
+
+
+def scan_media_root(media_root):
+    """
+    Walk media_root once with os.scandir.
+
+    Returns (paths, dir_mtimes): the first path seen for each basename, in
+    the same top-down order os.walk visits them, and the mtime of every
+    directory scanned.
+    """
+    paths = {}
+    dir_mtimes = {}
+    stack = [media_root]
+    while stack:
+        top = stack.pop()
+        try:
+            dir_mtimes[top] = os.stat(top).st_mtime_ns
+            entries = list(os.scandir(top))
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    # Like os.walk, symlinked directories are not followed
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+            except OSError:
+                continue
+            paths.setdefault(entry.name, entry.path)
+        # Visit subdirectories in listing order, depth first
+        stack.extend(reversed(subdirs))
+    return paths, dir_mtimes
+
+
+class MediaIndex:
+    """
+    Cached basename -> path lookups for media roots.
+
+    Indexes are kept in memory and pickled under root, and rebuilt when the
+    mtime of any directory in the tree has changed (a file was added, removed
+    or renamed). Checking that costs one stat per directory, not per file.
+    At most max_roots indexes are kept.
+    """
+
+    def __init__(self, root, max_roots=INDEX_MAX_ROOTS):
+        self.root = root
+        self.max_roots = max_roots
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, media_root):
+        return os.path.join(self.root, hashlib.sha256(media_root.encode('utf-8')).hexdigest() + '.pkl')
+
+    @staticmethod
+    def _fresh(dir_mtimes):
+        for path, mtime in dir_mtimes.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _load(self, media_root):
+        try:
+            with open(self._path(media_root), 'rb') as f:
+                version, paths, dir_mtimes = pickle.load(f)
+        except Exception:
+            return None
+        if version != _INDEX_VERSION:
+            return None
+        return paths, dir_mtimes
+
+    def _save(self, media_root, index):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((_INDEX_VERSION, *index), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(media_root))
+        except Exception as e:
+            print(f"Could not save media index for {media_root}: {e}")
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            return
+        self._trim()
+
+    def _trim(self):
+        # Least recently saved pickles go first
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.pkl'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        for _, path in sorted(entries)[:max(0, len(entries) - self.max_roots)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, media_root, persist=True):
+        """
+        basename -> path for everything under media_root. persist=False scans
+        without keeping the index, for throwaway directories.
+        """
+        media_root = os.path.abspath(media_root)
+        if not persist:
+            return scan_media_root(media_root)[0]
+        with self._lock:
+            index = self._indexes.pop(media_root, None) or self._load(media_root)
+            if index is None or not self._fresh(index[1]):
+                index = scan_media_root(media_root)
+                self._save(media_root, index)
+            self._indexes[media_root] = index
+            while len(self._indexes) > self.max_roots:
+                self._indexes.popitem(last=False)
+            return index[0]
+
+    def find(self, basenames, media_root, persist=True):
+        """Paths of the given basenames under media_root, in basename order."""
+        if not media_root or not basenames:
+            return []
+        paths = self.get(media_root, persist)
+        return [paths[b] for b in basenames if b in paths]
+
+
+_default_index = None
+
+
+def get_media_index():
+    global _default_index
+    if _default_index is None:
+        _default_index = MediaIndex(INDEX_DIR)
+    return _default_index
@@ -0,0 +1,174 @@
+import threading
+
+from timings import PHASES
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_labels(self.label_names, key)} {_number(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def sync(self, total, **labels):
+        """Bring the count up to a running total kept elsewhere; it never goes down."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = max(self._values.get(key, 0), total)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _labels(self.label_names + ('le',), key + (_number(bound),))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _labels(self.label_names, key)
+        lines.append(f'{self.name}_sum{labels} {_number(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """
+    A minimal in-process Prometheus registry: counters, gauges and
+    histograms rendered in the text exposition format. Values live in this
+    process only, so each uvicorn worker reports its own.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = Registry()
+
+requests_total = registry.counter('wrapped_requests_total', "HTTP requests handled.", ('method', 'path', 'status'))
+request_seconds = registry.histogram('wrapped_request_duration_seconds', "HTTP request latency.", ('method', 'path'))
+requests_in_flight = registry.gauge('wrapped_requests_in_flight', "HTTP requests being handled.")
+analyses_running = registry.gauge('wrapped_analyses_running', "Admitted analyses running on a worker.")
+analyses_queued = registry.gauge('wrapped_analyses_queued', "Admitted analyses waiting for a worker.")
+analyses_rejected = registry.counter('wrapped_analyses_rejected_total', "Analyses turned away since startup.")
+in_flight_bytes = registry.gauge('wrapped_in_flight_bytes', "Upload bytes held by admitted analyses.")
+analysis_seconds = registry.histogram('wrapped_analysis_duration_seconds', "Wall time of whole analyses.", ('kind',))
+phase_seconds = registry.counter('wrapped_phase_seconds_total', "Time spent per analysis phase.", ('phase', 'clock'))
+phase_duration = registry.histogram('wrapped_phase_duration_seconds', "Wall time of a phase within one analysis.", ('phase',))
+processed = registry.counter('wrapped_processed_total', "Work done by analyses (messages, words, bytes, parts, errors).", ('what',))
+
+
+def record_analysis(timings, kind, seconds):
+    """Add one finished analysis' Timings to the metrics."""
+    analysis_seconds.observe(seconds, kind=kind)
+    for phase in PHASES:
+        if phase in timings.wall:
+            phase_seconds.inc(timings.wall[phase], phase=phase, clock='wall')
+            phase_seconds.inc(timings.cpu[phase], phase=phase, clock='cpu')
+            phase_duration.observe(timings.wall[phase], phase=phase)
+    for name, value in timings.counters.items():
+        processed.inc(value, what=name)
+
+
+def record_admission(stats):
+    analyses_running.set(stats["running"])
+    analyses_queued.set(stats["queued"])
+    analyses_rejected.sync(stats["rejected"])
+    in_flight_bytes.set(stats["in_flight_bytes"])
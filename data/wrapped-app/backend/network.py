@@ -0,0 +1,97 @@
+import heapq
+import os
+import random
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Cap on the links sent to NetworkGraph.tsx (strongest by combined likes); 0 keeps all
+NETWORK_MAX_LINKS = int(os.environ.get('WRAPPED_NETWORK_MAX_LINKS', '0'))
+
+
+def _select(values, k):
+    """k-th smallest value (0-based) without sorting everything."""
+    if np is not None:
+        return float(np.partition(np.asarray(values, dtype=np.float64), k)[k])
+    # Quickselect with a random pivot
+    rng = random.Random(len(values))
+    while True:
+        pivot = values[rng.randrange(len(values))]
+        lower = [v for v in values if v < pivot]
+        if k < len(lower):
+            values = lower
+            continue
+        equal = sum(1 for v in values if v == pivot)
+        if k < len(lower) + equal:
+            return pivot
+        k -= len(lower) + equal
+        values = [v for v in values if v > pivot]
+
+
+def pair_likes(participants, likes_matrix):
+    """
+    Sparse (COO-style) undirected edge list: {(p1, p2): combined likes} with
+    p1 < p2, built only from the actor -> sender entries that exist.
+    """
+    members = set(participants)
+    combined = Counter()
+    for actor, row in likes_matrix.items():
+        if actor not in members:
+            continue
+        for sender, likes in row.items():
+            if sender == actor or sender not in members or not likes:
+                continue
+            combined[(actor, sender) if actor < sender else (sender, actor)] += likes
+    return combined
+
+
+def build_network_data(participants, likes_matrix, likes_given, max_links=None):
+    """
+    Likes network between participants, with links bucketed into tertiles by
+    ratio (combined likes / combined likes given). Only pairs that actually
+    exchanged likes are visited. max_links (default WRAPPED_NETWORK_MAX_LINKS)
+    keeps just the strongest links so the graph stays renderable.
+    """
+    if max_links is None:
+        max_links = NETWORK_MAX_LINKS
+    nodes = [{"id": p} for p in participants]
+
+    # Same order as walking every (i < j) pair of the sorted participants
+    pair_data = []
+    for (p1, p2), combined_likes in sorted(pair_likes(participants, likes_matrix).items()):
+        combined_likes_given = likes_given[p1] + likes_given[p2]
+        if combined_likes_given > 0:
+            pair_data.append({
+                "source": p1,
+                "target": p2,
+                "value": combined_likes,
+                "ratio": combined_likes / combined_likes_given
+            })
+
+    if pair_data:
+        # Thresholds for 3 even levels (tertiles)
+        all_ratios = [p['ratio'] for p in pair_data]
+        num_links = len(all_ratios)
+        low_thresh = _select(all_ratios, num_links // 3)
+        med_thresh = _select(all_ratios, (2 * num_links) // 3)
+
+        for p in pair_data:
+            if p['ratio'] <= low_thresh:
+                p['strength'] = "Low"
+            elif p['ratio'] <= med_thresh:
+                p['strength'] = "Medium"
+            else:
+                p['strength'] = "High"
+
+    links = pair_data
+    if max_links and len(links) > max_links:
+        keep = heapq.nlargest(max_links, range(len(links)), key=lambda i: links[i]['value'])
+        links = [links[i] for i in sorted(keep)]
+
+    return {
+        "nodes": nodes,
+        "links": links
+    }
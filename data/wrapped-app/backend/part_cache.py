@@ -0,0 +1,156 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+from aggregators import STATE_VERSION
+
+# Where per-part aggregates are kept and how much disk they may use.
+# Setting WRAPPED_CACHE_MAX_BYTES=0 disables the cache.
+CACHE_DIR = os.environ.get('WRAPPED_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'part_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('WRAPPED_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def part_key(file_info, salt='', seed=None):
+    """
+    SHA-256 of a part's bytes, the aggregator STATE_VERSION, salt (the
+    lexicon fingerprint) and the quiz sampling seed, if any, or None if the
+    part is a stream that can't be rewound after hashing. A partial's quiz
+    samples come from its seed's RNG, so seeded parts get keys of their own.
+    """
+    prefix = f'v{STATE_VERSION}:{salt}:' if seed is None else f'v{STATE_VERSION}:{salt}:seed={seed}:'
+    h = hashlib.sha256(prefix.encode('utf-8'))
+    if file_info.get('path') is not None:
+        with open(file_info['path'], 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                h.update(chunk)
+    elif file_info.get('stream') is not None:
+        stream = file_info['stream']
+        if not stream.seekable():
+            return None
+        start = stream.tell()
+        for chunk in iter(lambda: stream.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+        stream.seek(start)
+    else:
+        content = file_info['content']
+        h.update(content.encode('utf-8') if isinstance(content, str) else content)
+    return h.hexdigest()
+
+
+class PartCache:
+    """
+    Content-addressed, on-disk cache of per-part ChatStats partials.
+
+    Entries are keyed by part_key() and evicted least-recently-used once the
+    directory grows past max_bytes. File mtimes double as the LRU clock so
+    several server processes can share one directory.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # Apply the size cap straight away in case it was lowered
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                partial = pickle.load(f)
+            # Touch so the entry counts as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            partial = None
+        except Exception as e:
+            print(f"Dropping unreadable cache entry {key}: {e}")
+            self._remove(path)
+            partial = None
+        with self._lock:
+            if partial is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return partial
+
+    def put(self, key, partial):
+        data = pickle.dumps(partial, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except Exception:
+            self._remove(tmp)
+            raise
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.pkl'):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        # Oldest first
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+_default_cache = None
+
+
+def get_part_cache():
+    """The process-wide cache configured from the environment, or None if disabled."""
+    global _default_cache
+    if CACHE_MAX_BYTES <= 0:
+        return None
+    if _default_cache is None:
+        _default_cache = PartCache(CACHE_DIR, CACHE_MAX_BYTES)
+    return _default_cache
@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import os
+
+from fastapi import Response
+
+try:
+    # Much faster than the json module for the large result dicts
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Payloads smaller than this are sent uncompressed; 0 turns compression off
+COMPRESS_MIN_BYTES = int(os.environ.get('WRAPPED_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('WRAPPED_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('WRAPPED_BROTLI_QUALITY', '5'))
+
+MSGPACK_TYPE = 'application/msgpack'
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _columns(rows):
+    # [{"a": 1, "b": 2}, ...] -> {"a": [1, ...], "b": [2, ...]}
+    if not rows or not all(isinstance(row, dict) for row in rows):
+        return rows
+    keys = list(dict.fromkeys(k for row in rows for k in row))
+    return {k: [row.get(k) for row in rows] for k in keys}
+
+
+def columnar(results):
+    """
+    Results with the chart and network row lists turned into one list per
+    field, which repeats no keys and compresses better.
+    """
+    results = dict(results)
+    if isinstance(results.get('chart_data'), dict):
+        results['chart_data'] = {name: _columns(rows) for name, rows in results['chart_data'].items()}
+    network = results.get('network_data')
+    if isinstance(network, dict):
+        results['network_data'] = {name: _columns(rows) for name, rows in network.items()}
+    return results
+
+
+def input_etag(part_keys, *variant):
+    """
+    Weak ETag for a result built from parts with these part_key()s, or None
+    if any part couldn't be keyed. Keys are hashed in upload order and with
+    repeats, since both change the result. variant distinguishes
+    representations (locale, format, layout, content coding) and anything
+    else that shapes the body. Weak, because some fields (session_id, the
+    quiz sample) differ between otherwise equivalent responses.
+    """
+    part_keys = list(part_keys)
+    if not part_keys or any(key is None for key in part_keys):
+        return None
+    h = hashlib.sha256()
+    for key in part_keys:
+        h.update(key.encode('ascii') + b';')
+    h.update(repr(variant).encode('utf-8'))
+    return f'W/"{h.hexdigest()[:40]}"'
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag.removeprefix('W/') in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+
+
+def negotiate(request):
+    """
+    (format, layout, content coding) for a results response.
+
+    ?format=msgpack (or Accept: application/msgpack) asks for MessagePack,
+    ?layout=columnar for column-oriented charts and network. The content
+    coding is br or gzip when the client accepts it. Raises ValueError for
+    a format this install can't produce.
+    """
+    fmt = request.query_params.get('format')
+    if fmt is None:
+        fmt = 'msgpack' if MSGPACK_TYPE in request.headers.get('accept', '') and msgpack is not None else 'json'
+    if fmt not in ('json', 'msgpack'):
+        raise ValueError(f"Unknown format '{fmt}'.")
+    if fmt == 'msgpack' and msgpack is None:
+        raise ValueError("MessagePack output needs the msgpack package.")
+    layout = request.query_params.get('layout', 'rows')
+    if layout not in ('rows', 'columnar'):
+        raise ValueError(f"Unknown layout '{layout}'.")
+
+    coding = None
+    if COMPRESS_MIN_BYTES > 0:
+        accepted = {part.split(';')[0].strip() for part in request.headers.get('accept-encoding', '').split(',')}
+        if brotli is not None and 'br' in accepted:
+            coding = 'br'
+        elif 'gzip' in accepted:
+            coding = 'gzip'
+    return fmt, layout, coding
+
+
+def results_response(results, fmt='json', layout='rows', coding=None, etag=None, status_code=200):
+    """Serialize (and compress) a results dict into a Response."""
+    if layout == 'columnar':
+        results = columnar(results)
+    if fmt == 'msgpack':
+        body, media_type = msgpack.packb(results, use_bin_type=True), MSGPACK_TYPE
+    else:
+        body, media_type = dumps_json(results), 'application/json'
+
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if coding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        if coding == 'br':
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = coding
+    if etag is not None:
+        headers['ETag'] = etag
+        headers['Cache-Control'] = 'private, no-cache'
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
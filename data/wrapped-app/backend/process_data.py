@@ -1,790 +1,283 @@
 import json
-import glob
+import logging
+import mmap
 import os
-import re
-from collections import defaultdict, Counter
-from datetime import datetime, timezone, timedelta
-
-
-def fix_text(text):
-    if not isinstance(text, str) or not text:
-        return text
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from aggregators import ChatStats
+from lexicon import get_lexicon
+from share_story import available_formats
+from part_cache import get_part_cache, part_key
+from timings import SampledClock, Timings
+
+try:
+    # Event-based parser so uploads can be analysed without loading whole files
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    # Decodes a mapped file in one pass, far faster than any key-by-key reader
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used to analyse export parts in parallel; 0 or 1 keeps the
+# analysis in the calling process.
+ANALYSIS_WORKERS = int(os.environ.get('WRAPPED_ANALYSIS_WORKERS', '0'))
+
+# How often (in messages) an in-process analysis reports progress
+PROGRESS_EVERY = 1000
+
+# Local files up to this size are memory-mapped and decoded whole, which holds
+# every message of the file (roughly twice its size) in memory at once.
+# Anything larger is streamed with ijson, one message at a time. The default
+# covers a regular 10,000-message export part.
+MMAP_MAX_BYTES = int(os.environ.get('WRAPPED_MMAP_MAX_BYTES', str(4 * 1024 * 1024)))
+
+# One worker pool per pool size, kept for the life of the process; analyses
+# on several job threads share them, so none is ever shut down under another
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _mapped_messages(path):
+    # The messages of a local file decoded straight from a read-only mapping,
+    # or None to stream it instead. Messages are handed out (and released)
+    # one by one, so the tree shrinks as the analysis works through it.
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if orjson is None or not 0 < size <= MMAP_MAX_BYTES:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                with memoryview(mm) as view:
+                    data = orjson.loads(view)
+            except orjson.JSONDecodeError:
+                # e.g. integers beyond 64 bits; the streaming parser copes
+                return None
+    if not isinstance(data, dict) or not isinstance(data.get('messages'), list):
+        return []
+    messages = data['messages']
+    messages.reverse()
+    return messages
+
+def iter_messages(file_info):
+    """
+    Yield the message dicts of one uploaded export part.
+
+    file_info may carry the raw JSON as 'content' (str or bytes), an open
+    binary file object as 'stream' or a local file 'path'. Local files are
+    memory-mapped and decoded with orjson when it is installed. Streams are
+    parsed incrementally with ijson when it is installed, so only one message
+    is materialised at a time.
+    """
+    path = file_info.get('path')
+    if path is not None:
+        messages = _mapped_messages(path)
+        if messages is not None:
+            while messages:
+                yield messages.pop()
+            return
+        with open(path, 'rb') as f:
+            yield from iter_messages({'stream': f})
+        return
+
+    stream = file_info.get('stream')
+    if stream is not None:
+        if ijson is not None:
+            yield from ijson.items(stream, 'messages.item', use_float=True)
+            return
+        data = json.load(stream)
+    else:
+        data = json.loads(file_info['content'])
+
+    if not isinstance(data, dict) or 'messages' not in data:
+        return
+    yield from data['messages']
+
+def _message_total(partial):
+    return sum(partial.messages_sent.counts.values())
+
+def _part_bytes(file_info):
+    # Bytes a part took up, once it has been read through
+    if file_info.get('path') is not None:
+        return os.path.getsize(file_info['path'])
+    if file_info.get('stream') is not None:
+        return file_info['stream'].tell()
+    return len(file_info['content'])
+
+def analyse_part(file_info, locale=None, seed=None, progress=None, timings=None):
+    """
+    Aggregate a single export part into its own ChatStats partial.
+
+    progress, if given, is called as progress(messages=n) with the newly
+    counted messages every PROGRESS_EVERY messages and once more at the end.
+    timings, if given (a timings.Timings), collects sampled per-phase times
+    and the messages, words and bytes processed. A part that can't be read
+    to the end keeps the messages counted so far and has partial.error set.
+    """
+    partial = ChatStats(locale, seed)
+    clock = SampledClock(timings) if timings is not None else None
+    reported = 0
     try:
-        # Facebook JSON often encodes UTF-8 bytes as Latin-1 characters.
-        return text.encode('latin1').decode('utf-8')
-    except (UnicodeEncodeError, UnicodeDecodeError):
+        messages = iter_messages(file_info)
+        if clock is not None:
+            # The first read can decode the whole file (see iter_messages), so
+            # it is timed in full rather than sampled and scaled up
+            with timings.phase('parse'):
+                first = next(messages, None)
+            if first is not None:
+                messages = chain((first,), messages)
+        i = 0
+        while True:
+            if clock is not None:
+                clock.start()
+            message = next(messages, None)
+            if message is None:
+                break
+            if clock is not None:
+                clock.lap('parse')
+            partial.update(message, clock)
+            i += 1
+            if progress is not None and i % PROGRESS_EVERY == 0:
+                counted = _message_total(partial)
+                progress(messages=counted - reported)
+                reported = counted
+    except Exception as e:
+        logger.warning("Error processing %s: %s", file_info.get('filename') or file_info.get('path') or 'part', e)
+        partial.error = str(e) or type(e).__name__
+        if timings is not None:
+            timings.count('errors')
+    if progress is not None:
+        progress(messages=_message_total(partial) - reported)
+    if timings is not None:
+        clock.flush()
+        timings.count('messages', _message_total(partial))
+        timings.count('words', sum(partial.word_counts.total.values()))
         try:
-            return text.encode('cp1252').decode('utf-8')
-        except:
-            return text
-
-def is_url(text):
-    if not isinstance(text, str):
-        return False
-    text_lower = text.lower()
-    return text_lower.startswith('http') or text_lower.startswith('www') or '://' in text_lower
-
-def process_uploaded_data(files_data):
-    # Data structures for stats
-    user_word_counts = defaultdict(Counter)
-    total_word_counts = Counter()
-    messages_with_likes = []
-    quiz_pool = []
-    user_image_counts = Counter()
-
-    # Special Rankings Data
-    all_messages = []  # Flattened list of all messages for time/reply analysis
-    user_likes_received = Counter()
-    user_messages_sent = Counter()
-    user_reels_sent = Counter()
-    user_longest_words = defaultdict(lambda: {"word": "", "length": 0})
-    user_likes_given = Counter() # Most Messages Liked
-    likes_matrix = defaultdict(lambda: defaultdict(int)) # actor -> sender likes
-    user_total_chars = Counter()
-    month_counts = Counter()
-    
-    # Combined profanity pattern for faster matching
-    _PROFANITY_RE = re.compile(r'\b([fF]+[uU]+[cC]+[kK]+|[sS]+[hH]+[iI]+[tT]+|[bB]+[iI]+[tT]+[cC]+[hH]+|[dD]+[aA]+[mM]+[nN]+|[aA]+[sS]+[sS]+|[hH]+[eE]+[lL]+[lL]+)[a-zA-Z]*\b')
-    user_profanity_counts = Counter()
-
-    STOPWORDS = {
-        'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd",
-        'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers',
-        'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which',
-        'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been',
-        'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if',
-        'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between',
-        'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out',
-        'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why',
-        'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not',
-        'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should',
-        "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't",
-        'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't",
-        'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't",
-        'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't", 'like', 'get', 'got', 'know',
-        'think', 'going', 'really', 'yeah', 'lol', 'lmao', 'good', 'well', 'much', 'see', 'want', 'one', 'even',
-        'message', 'liked', 'im', 'guys', 'sent', 'attachment', 'dont', 'ur', 'thats',
-        'yeah', 'yes', 'no', 'ok', 'okay', 'like', 'get', 'got', 'know', 'think', 'going',
-        'really', 'good', 'well', 'much', 'see', 'want', 'one', 'even', 'right', 'mean',
-        'thing', 'things', 'still', 'actually', 'probably', 'maybe', 'sure', 'back',
-        'come', 'take', 'look', 'want', 'gonna', 'wanna', 'gotta', 'lol', 'lmao', 'lmfao',
-        'haha', 'hahaha', 'ah', 'oh', 'hey', 'hi', 'hello'
-    }
-
-    # Small mapping to expand common contractions so we don't end up with tokens like "thats"
-    CONTRACTIONS_MAP = {
-        "ain't": "is not",
-        "aren't": "are not",
-        "can't": "cannot",
-        "can't've": "cannot have",
-        "could've": "could have",
-        "couldn't": "could not",
-        "couldn't've": "could not have",
-        "didn't": "did not",
-        "doesn't": "does not",
-        "don't": "do not",
-        "hadn't": "had not",
-        "hadn't've": "had not have",
-        "hasn't": "has not",
-        "haven't": "have not",
-        "he'd": "he would",
-        "he'd've": "he would have",
-        "he'll": "he will",
-        "he's": "he is",
-        "i'd": "i would",
-        "i'd've": "i would have",
-        "i'll": "i will",
-        "i'm": "i am",
-        "i've": "i have",
-        "isn't": "is not",
-        "it's": "it is",
-        "let's": "let us",
-        "mightn't": "might not",
-        "mustn't": "must not",
-        "shan't": "shall not",
-        "she's": "she is",
-        "should've": "should have",
-        "shouldn't": "should not",
-        "that's": "that is",
-        "there's": "there is",
-        "they're": "they are",
-        "they've": "they have",
-        "we're": "we are",
-        "we've": "we have",
-        "weren't": "were not",
-        "what's": "what is",
-        "won't": "will not",
-        "wouldn't": "would not",
-        "you'd": "you would",
-        "you'll": "you will",
-        "you're": "you are",
-        # Add defensive lowercase variants without apostrophes commonly produced by earlier cleaning
-        'thats': 'that is',
-        'dont': 'do not',
-        'im': 'i am',
-        'ive': 'i have',
-        'cant': 'cannot',
-        'its': 'it is'
-    }
-
-    # Pre-compile contractions regex for speed
-    _CONTRACTIONS_RE = re.compile(r'\b(' + '|'.join(re.escape(key) for key in CONTRACTIONS_MAP.keys()) + r')\b', re.IGNORECASE)
-
-    def expand_contractions(text):
-        if not isinstance(text, str) or not text:
-            return text
-        # Normalize simple unicode apostrophes
-        t = text.replace('\u2019', "'").replace('\u2018', "'")
-        return _CONTRACTIONS_RE.sub(lambda m: CONTRACTIONS_MAP.get(m.group(0).lower(), m.group(0)), t.lower())
-
-    # Fast word filter heuristic
-    def _fast_filter_words(words):
-        allowed = []
-        for w in words:
-            wl = w.lower()
-            if len(wl) <= 2: continue
-            if wl in STOPWORDS: continue
-            # Simple heuristic: ignore common pronouns/determiners that might have slipped through
-            if wl in {'that', 'this', 'these', 'those', 'they', 'them', 'their', 'there'}: continue
-            if re.match(r'^[a-zA-Z]+$', wl):
-                allowed.append(wl)
-        return allowed
-
-    collected_media_basenames = set()
+            timings.count('bytes', _part_bytes(file_info))
+        except (OSError, ValueError):
+            pass
+    return partial
+
+def _analyse_part_timed(file_info, locale, seed):
+    # Worker entry point: the partial plus the worker's own timings
+    timings = Timings()
+    partial = analyse_part(file_info, locale, seed, timings=timings)
+    return partial, timings
+
+def _get_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+def _portable_part(file_info):
+    # Open upload streams can't be sent to another process, so ship their bytes
+    stream = file_info.get('stream')
+    if stream is None:
+        return file_info
+    return {"filename": file_info.get('filename'), "content": stream.read()}
+
+def analyse_parts(files_data, workers=None, cache=None, base=None, locale=None, seed=None, progress=None, timings=None):
+    """
+    Aggregate every part and merge the partials in upload order.
+
+    When base (a previously merged ChatStats) is given the parts are merged
+    into it, skipping any part it already contains, and its locale wins. seed
+    makes the quiz sampling reproducible. Parts whose bytes are in
+    the part cache are not re-analysed. With more than one worker the
+    remaining parts are fanned out to a process pool; at most two parts per
+    worker are in flight so uploaded bytes are not all held at once.
+
+    progress, if given, is called as progress(files=..., messages=...) with
+    increments as parts are merged, so callers can report how far along the
+    analysis is. timings, if given, gathers per-phase times and counters from
+    every part analysed, including those run in worker processes.
+    """
+    if workers is None:
+        workers = ANALYSIS_WORKERS
+    if cache is None:
+        cache = get_part_cache()
+    pool = _get_pool(workers) if workers > 1 and len(files_data) > 1 else None
+
+    chat = base if base is not None else ChatStats(locale, seed)
+    lexicon = get_lexicon(chat.locale)
+    already_merged = set(chat.part_keys)
+    pending = deque()
+
+    def drain(limit):
+        while len(pending) > limit:
+            key, partial, counted = pending.popleft()
+            if not isinstance(partial, ChatStats):
+                partial = partial.result()
+                if timings is not None:
+                    partial, part_timings = partial
+                    timings.merge(part_timings)
+                if cache is not None and key is not None and partial.error is None:
+                    cache.put(key, partial)
+            chat.merge(partial)
+            if key is not None:
+                chat.part_keys.add(key)
+            if progress is not None:
+                # Parts from the pool or the cache report their messages here
+                progress(files=1, messages=0 if counted else _message_total(partial))
 
     for file_info in files_data:
-        try:
-            data = json.loads(file_info['content'])
-            
-            if 'messages' not in data:
-                continue
-
-            for message in data['messages']:
-                if 'sender_name' not in message:
-                    continue
-                    
-                sender = fix_text(message['sender_name'])
-                
-                # Exclude Meta AI
-                if sender == "Meta AI":
-                    continue
-                    
-                user_messages_sent[sender] += 1
-
-                # Store for chronological processing
-                if 'timestamp_ms' in message:
-                    # Fix sender name in stored message too for consistency later
-                    message['sender_name'] = sender
-                    all_messages.append(message)
-
-                # 1. Word Counts & Longest Word & Profanity
-                if 'content' in message:
-                    content = fix_text(message['content'])
-                    # Expand contractions (so "that's" -> "that is" and gets removed by stopwords)
-                    content = expand_contractions(content)
-                    user_total_chars[sender] += len(content)
-
-                    # Split into words first
-                    raw_words = content.split()
-
-                    # Filter out URLs
-                    non_url_words = [w for w in raw_words if not is_url(w)]
-
-                    # Process for Word Counts
-                    processed_words = []
-                    for w in non_url_words:
-                        # Check for profanity in a single regex pass
-                        if _PROFANITY_RE.match(w):
-                            user_profanity_counts[sender] += 1
-
-                        # Basic tokenization: lowercase and remove non-alphanumeric characters
-                        cleaned = re.sub(r'[^\w\s]', '', w.lower())
-                        # Also strip surrounding punctuation
-                        cleaned = cleaned.strip()
-                        if cleaned and cleaned not in STOPWORDS and len(cleaned) > 1:
-                            processed_words.append(cleaned)
-
-                    # Filter words using fast heuristic
-                    pos_words = _fast_filter_words(processed_words)
-                    user_word_counts[sender].update(pos_words)
-                    total_word_counts.update(pos_words)
-
-                    # Track longest word (Exclude links and non-alpha)
-                    for word in non_url_words:
-                        # Clean word for length check (remove punctuation from ends)
-                        clean_word = re.sub(r'^[^\w]+|[^\w]+$', '', word)
-
-                        # Strict check: Must be purely English letters to avoid emojis/symbols/mojibake
-                        if not re.match(r'^[a-zA-Z]+$', clean_word):
-                            continue
-
-                        if len(clean_word) > user_longest_words[sender]["length"]:
-                            user_longest_words[sender] = {"word": clean_word, "length": len(clean_word)}
-
-
-                    # Check for Reels
-                    if "instagram.com/reel" in content:
-                        user_reels_sent[sender] += 1
-                    elif 'share' in message and isinstance(message.get('share'), dict) and 'link' in message['share'] and "instagram.com/reel" in message['share']['link']:
-                        user_reels_sent[sender] += 1
-
-
-                # 3. Most Liked Messages & Aura (Likes Received) & Likes Given & Matrix
-                if 'reactions' in message:
-                    like_count = len(message['reactions'])
-                    if like_count > 0:
-                        user_likes_received[sender] += like_count
-                        
-                        # Track who GAVE the likes
-                        for reaction in message['reactions']:
-                            if 'actor' in reaction:
-                                actor = fix_text(reaction['actor'])
-                                if actor == "Meta AI":
-                                    continue
-                                user_likes_given[actor] += 1
-                                likes_matrix[actor][sender] += 1
-                        
-                        # Fix content encoding and filter out media-only messages
-                        raw_content = message.get('content', '')
-                        if not raw_content or raw_content == '[Media/No Content]':
-                            continue
-                            
-                        fixed_content = fix_text(raw_content)
-                        
-                        msg_info = {
-                            "content": fixed_content,
-                            "sender": sender,
-                            "likes": like_count,
-                            "timestamp": message.get('timestamp_ms', 0)
-                        }
-                        
-                        # 6. Quiz Pool (Sentences)
-                        if 30 < len(fixed_content) < 150 and not is_url(fixed_content):
-                            quiz_pool.append({"content": fixed_content, "sender": sender})
-
-                        messages_with_likes.append(msg_info)
-
-                # 6. Image/Media Stats (robust detection for screenshots and attachments)
-                media_count = 0
-                media_uris = []
-
-                # Explicit photo lists
-                photos = message.get('photos')
-                if isinstance(photos, list):
-                    media_count += len(photos)
-                    for p in photos:
-                        if isinstance(p, dict):
-                            uri = p.get('uri') or p.get('uri_image') or p.get('uri_raw') or p.get('url')
-                            if isinstance(uri, str) and uri:
-                                media_uris.append(uri)
-                elif photos:
-                    media_count += 1
-
-                # Videos
-                videos = message.get('videos')
-                if isinstance(videos, list):
-                    media_count += len(videos)
-                    for v in videos:
-                        if isinstance(v, dict):
-                            uri = v.get('uri') or v.get('url')
-                            if isinstance(uri, str) and uri:
-                                media_uris.append(uri)
-                elif videos:
-                    media_count += 1
-
-                # GIFs
-                gifs = message.get('gifs')
-                if isinstance(gifs, list):
-                    media_count += len(gifs)
-                    for g in gifs:
-                        if isinstance(g, dict):
-                            uri = g.get('uri') or g.get('url')
-                            if isinstance(uri, str) and uri:
-                                media_uris.append(uri)
-                elif gifs:
-                    media_count += 1
-
-                # Sticker
-                if 'sticker' in message:
-                    media_count += 1
-                    st = message.get('sticker')
-                    if isinstance(st, dict):
-                        uri = st.get('uri') or st.get('url')
-                        if isinstance(uri, str) and uri:
-                            media_uris.append(uri)
-
-                # Attachments: often where screenshots live
-                for att in message.get('attachments', []) or []:
-                    if not isinstance(att, dict):
-                        continue
-                    atype = (att.get('type') or '').lower()
-
-                    # Common attachment types that represent media
-                    if atype in ('photo', 'image', 'video', 'gif', 'sticker', 'file'):
-                        media_count += 1
-                        media = att.get('media') or att.get('image') or att.get('photo') or {}
-                        if isinstance(media, dict):
-                            uri = media.get('uri') or media.get('uri_image') or media.get('uri_raw') or media.get('url') or media.get('src')
-                            if isinstance(uri, str) and uri:
-                                media_uris.append(uri)
-                        continue
-
-                    # Fallback: check nested media/image dicts for file URIs
-                    media = att.get('media') or att.get('image') or att.get('photo') or {}
-                    if isinstance(media, dict):
-                        uri = media.get('uri') or media.get('uri_image') or media.get('url') or media.get('src')
-                        if isinstance(uri, str) and re.search(r'\.(png|jpe?g|gif|bmp|webp)$', uri, flags=re.I):
-                            media_count += 1
-                            media_uris.append(uri)
-
-                # Files array (some exports put attachments here)
-                for f in message.get('files', []) or []:
-                    if isinstance(f, dict):
-                        uri = f.get('uri') or f.get('uri_raw') or f.get('name') or f.get('file')
-                        if isinstance(uri, str) and re.search(r'\.(png|jpe?g|gif|bmp|webp)$', uri, flags=re.I):
-                            media_count += 1
-                            media_uris.append(uri)
-
-                # Share links that might point to images
-                share = message.get('share') or {}
-                if isinstance(share, dict):
-                    link = share.get('link') or share.get('href')
-                    if isinstance(link, str) and re.search(r'\.(png|jpe?g|gif|bmp|webp)$', link, flags=re.I):
-                        media_count += 1
-                        media_uris.append(link)
-
-                # Heuristic: filenames embedded in content (IMG_, Screenshot, date patterns)
-                if media_count == 0:
-                    content_for_media = message.get('content', '')
-                    if isinstance(content_for_media, str) and re.search(r'(IMG[_-]\d+|Screenshot_?\d+|\d{8}_\d{6}|\.(png|jpe?g))', content_for_media, flags=re.I):
-                        media_count += 1
-
-                if media_count:
-                    user_image_counts[sender] += media_count
-                    # Expose detected URIs to the message for downstream zipping/collecting logic
-                    if media_uris:
-                        # Normalize URIs and collect basenames so the zipper can find files in the export
-                        normalized = []
-                        basenames = []
-                        for uri in media_uris:
-                            if not isinstance(uri, str):
-                                continue
-                            u = uri.strip()
-                            # Keep data-URI or absolute URLs as-is
-                            if u.startswith('data:') or re.search(r'https?://', u):
-                                if u not in normalized:
-                                    normalized.append(u)
-                                continue
-
-                            # Strip common leading path fragments
-                            u_clean = re.sub(r'^(?:\./|\.\./|/)+', '', u)
-                            # Some exports prefix with 'photos/' or 'images/' - keep full path but also capture basename
-                            base = os.path.basename(u_clean)
-                            if base:
-                                if base not in basenames:
-                                    basenames.append(base)
-                                if u_clean not in normalized:
-                                    normalized.append(u_clean)
-                            else:
-                                if u_clean not in normalized:
-                                    normalized.append(u_clean)
-                        
-                        message['media_uris'] = normalized
-                        message['media_basenames'] = basenames
-                        for b in basenames:
-                            collected_media_basenames.add(b)
-
-        except Exception as e:
-            print(f"Error processing file: {e}")
-
-    # --- Compile Stats ---
-
-    # Sort all messages by timestamp for time-based analysis
-    all_messages.sort(key=lambda x: x.get('timestamp_ms', 0))
-
-    # Time-based Analysis & Replies
-    night_owl_counts = Counter()
-    morning_person_counts = Counter()
-    replied_to_counts = Counter()
-
-    # Timezone: UTC-8 (PST)
-    pst_tz = timezone(timedelta(hours=-8))
-
-    for i, msg in enumerate(all_messages):
-        sender = msg.get('sender_name')
-        ts_ms = msg.get('timestamp_ms', 0)
-        
-        # Convert to datetime in PST
-        dt = datetime.fromtimestamp(ts_ms / 1000.0, tz=pst_tz)
-        hour = dt.hour
-
-        # Night Owl: 12 AM - 5 AM (0 - 5)
-        if 0 <= hour < 5:
-            night_owl_counts[sender] += 1
-        
-        # Morning Person: 6 AM - 11 AM (6 - 11)
-        elif 6 <= hour < 12:
-            morning_person_counts[sender] += 1
-        
-        # Peak Activity Month
-        month_key = dt.strftime('%B %Y')
-        month_counts[month_key] += 1
-        
-        # Most Replied To Heuristic
-        if i < len(all_messages) - 1:
-            next_msg = all_messages[i+1]
-            next_ts = next_msg.get('timestamp_ms', 0)
-            next_sender = next_msg.get('sender_name')
-            
-            if next_sender != sender:
-                time_diff = (next_ts - ts_ms) / 1000.0 # seconds
-                if time_diff < 300: # 5 minutes
-                    replied_to_counts[sender] += 1
-
-    # Average Response Time Analysis
-    user_response_times = defaultdict(list)
-    for i in range(1, len(all_messages)):
-        prev_msg = all_messages[i-1]
-        curr_msg = all_messages[i]
-        prev_sender = prev_msg.get('sender_name')
-        curr_sender = curr_msg.get('sender_name')
-        
-        if prev_sender != curr_sender:
-            time_diff = (curr_msg.get('timestamp_ms', 0) - prev_msg.get('timestamp_ms', 0)) / 1000.0
-            # Only count if it's within a reasonable "conversation" window, e.g., 12 hours
-            if time_diff < 43200: 
-                user_response_times[curr_sender].append(time_diff)
-
-    avg_response_times = []
-    for user, times in user_response_times.items():
-        if len(times) >= 5:
-            avg_response_times.append([user, sum(times) / len(times)])
-    
-    # Average Message Length
-    avg_lengths = []
-    for user in user_messages_sent:
-        if user_messages_sent[user] > 0:
-            avg_lengths.append([user, user_total_chars[user] / user_messages_sent[user]])
-    
-
-    # --- Generate Rankings ---
-
-    def get_top_10(counter_obj):
-        return counter_obj.most_common(10)
-
-    # 1. Top 10 words per user
-    top_words_per_user = {}
-    for user, counter in user_word_counts.items():
-        top_words_per_user[user] = counter.most_common(10)
-
-    # 2. Top 10 words overall
-    top_words_overall = total_word_counts.most_common(10)
-
-    # 3. Top 10 liked messages
-    top_liked_messages = sorted(messages_with_likes, key=lambda x: x['likes'], reverse=True)[:10]
-
-    # 6. Top 10 image senders
-    top_image_senders = user_image_counts.most_common(10)
-
-    # --- Special Rankings ---
-    
-    # Night Owls
-    top_night_owls = get_top_10(night_owl_counts)
-    
-    # Morning Person
-    top_morning_persons = get_top_10(morning_person_counts)
-    
-    # Most Replied To
-    top_replied_to = get_top_10(replied_to_counts)
-    
-    # Most Reels Sent
-    top_reels_sent = get_top_10(user_reels_sent)
-    
-    # Longest Word Sent (Top 10 users by longest word length)
-    longest_word_list = [{"user": u, "word": d["word"], "length": d["length"]} for u, d in user_longest_words.items()]
-    top_longest_words = sorted(longest_word_list, key=lambda x: x['length'], reverse=True)[:10]
-    
-    # Most Aura (Likes Received / Messages Sent)
-    # Higher Ratio = Better Aura (More likes per message)
-    aura_scores = []
-    for user in user_messages_sent:
-        sent = user_messages_sent[user]
-        received = user_likes_received[user]
-        
-        # Filter out low activity users
-        if sent < 10:
+        # Callers that hashed the parts already (for an ETag) pass the key along
+        key = file_info['key'] if 'key' in file_info else part_key(file_info, lexicon.fingerprint, seed)
+        if key is not None and key in already_merged:
+            if progress is not None:
+                progress(files=1)
+            if timings is not None:
+                timings.count('parts_skipped')
             continue
-            
-        # Formula: Received / Sent
-        ratio = received / sent
-             
-        aura_scores.append([user, ratio])
-        
-    # Sort by ratio DESCENDING (Highest Ratio First)
-    top_aura = sorted(aura_scores, key=lambda x: x[1], reverse=True)[:10]
-    
-    # Most Messages Liked (Likes Given)
-    top_messages_liked = get_top_10(user_likes_given)
-
-    # Construct final stats object (Original)
-    # Shuffle and pick a diverse set for the quiz
-    import random
-    random.shuffle(quiz_pool)
-    # Try to get unique messages from different senders
-    seen_senders = set()
-    final_quiz = []
-    for msg in quiz_pool:
-        if msg['sender'] not in seen_senders or len(seen_senders) > 10:
-            final_quiz.append(msg)
-            seen_senders.add(msg['sender'])
-        if len(final_quiz) >= 15:
-            break
-
-    stats = {
-        "top_words_per_user": top_words_per_user,
-        "top_words_overall": top_words_overall,
-        "top_liked_messages": top_liked_messages,
-        "top_image_senders": top_image_senders,
-        "quiz_pool": final_quiz,
-        # Expose detected media basenames and available share methods so the UI can show buttons
-        "media_files": sorted(list(collected_media_basenames)),
-        "share_story_options": ['html', 'pptx', 'pdf']
-    }
-
-    # Construct rankings object (New)
-    rankings = {
-        "night_owls": top_night_owls,
-        "morning_person": top_morning_persons,
-        "most_replied_to": top_replied_to,
-        "most_reels_sent": top_reels_sent,
-        "longest_word_sent": top_longest_words,
-        "most_aura": top_aura,
-        "most_messages_liked": top_messages_liked,
-        "most_profanity": get_top_10(user_profanity_counts),
-        "avg_response_times": sorted(avg_response_times, key=lambda x: x[1])[:10], # Fastest first
-        "slowest_responders": sorted(avg_response_times, key=lambda x: x[1], reverse=True)[:10],
-        "avg_message_lengths": sorted(avg_lengths, key=lambda x: x[1], reverse=True)[:10],
-        "peak_month": month_counts.most_common(1)[0] if month_counts else ("None", 0),
-    }
-
-    # --- Generate Network Data ---
-    participants = sorted(list(user_messages_sent.keys()))
-    nodes = [{"id": p} for p in participants]
-    links = []
-    
-    # Calculate combined likes and ratios for all pairs
-    pair_data = []
-    for i in range(len(participants)):
-        for j in range(i + 1, len(participants)):
-            p1 = participants[i]
-            p2 = participants[j]
-            combined_likes = likes_matrix[p1][p2] + likes_matrix[p2][p1]
-            combined_likes_given = user_likes_given[p1] + user_likes_given[p2]
-            
-            if combined_likes > 0 and combined_likes_given > 0:
-                ratio = combined_likes / combined_likes_given
-                pair_data.append({
-                    "source": p1,
-                    "target": p2,
-                    "value": combined_likes,
-                    "ratio": ratio
-                })
-    
-    if pair_data:
-        # Sort ratios to find quantile thresholds
-        all_ratios = sorted([p['ratio'] for p in pair_data])
-        num_links = len(all_ratios)
-        
-        # Thresholds for 3 even levels (tertiles)
-        low_thresh = all_ratios[num_links // 3]
-        med_thresh = all_ratios[(2 * num_links) // 3]
-        
-        for p in pair_data:
-            if p['ratio'] <= low_thresh:
-                p['strength'] = "Low"
-            elif p['ratio'] <= med_thresh:
-                p['strength'] = "Medium"
+        partial = cache.get(key) if cache is not None and key is not None else None
+        counted = False
+        if timings is not None:
+            timings.count('parts_cached' if partial is not None else 'parts_analysed')
+        if partial is None:
+            if pool is not None and timings is not None:
+                partial = pool.submit(_analyse_part_timed, _portable_part(file_info), chat.locale, seed)
+            elif pool is not None:
+                partial = pool.submit(analyse_part, _portable_part(file_info), chat.locale, seed)
             else:
-                p['strength'] = "High"
-            links.append(p)
-
-    network_data = {
-        "nodes": nodes,
-        "links": links
-    }
-
-    # --- Chart Data ---
-    chart_data = {
-        "messages_sent": [{"name": u, "value": v} for u, v in user_messages_sent.most_common(15)],
-        "likes_given": [{"name": u, "value": v} for u, v in user_likes_given.most_common(15)],
-        "likes_received": [{"name": u, "value": v} for u, v in user_likes_received.most_common(15)],
-        "reels_sent": [{"name": u, "value": v} for u, v in user_reels_sent.most_common(15)],
-    }
-
-    # --- Share Story Generators ---
-    # Helper: find image files in a media root by basename list
-    def _find_files_by_basename(basenames, media_root):
-        matches = []
-        if not media_root or not basenames:
-            return matches
-        for root, dirs, files in os.walk(media_root):
-            for b in basenames:
-                if b in files:
-                    matches.append(os.path.join(root, b))
-        # Keep original order of basenames where possible
-        ordered = []
-        for b in basenames:
-            for p in matches:
-                if os.path.basename(p) == b:
-                    ordered.append(p)
-                    break
-        return ordered or matches
-
-    def create_html_deck(image_paths, out_html):
-        try:
-            import base64
-            parts = []
-            parts.append('<!doctype html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1"></head><body style="margin:0;background:#000;">')
-            for p in image_paths:
-                try:
-                    with open(p, 'rb') as f:
-                        data = f.read()
-                    b64 = base64.b64encode(data).decode('ascii')
-                    mime = 'image/png'
-                    if re.search(r'\.jpe?g$', p, flags=re.I):
-                        mime = 'image/jpeg'
-                    parts.append(f'<div style="page-break-after:always;width:100%;height:100vh;display:flex;align-items:center;justify-content:center"><img src="data:{mime};base64,{b64}" style="max-width:100%;max-height:100%;"/></div>')
-                except Exception:
-                    continue
-            parts.append('</body></html>')
-            with open(out_html, 'w', encoding='utf-8') as f:
-                f.write(''.join(parts))
-            return out_html
-        except Exception:
-            return None
-
-    def create_pptx_from_images(image_paths, out_pptx):
-        try:
-            from pptx import Presentation
-            from pptx.util import Inches
-        except Exception:
-            return None
-        try:
-            prs = Presentation()
-            # Use blank layout for slides
-            blank = prs.slide_layouts[6] if len(prs.slide_layouts) > 6 else prs.slide_layouts[5]
-            for img in image_paths:
-                try:
-                    slide = prs.slides.add_slide(blank)
-                    left = top = 0
-                    slide.shapes.add_picture(img, left, top, width=prs.slide_width)
-                except Exception:
-                    continue
-            prs.save(out_pptx)
-            return out_pptx
-        except Exception:
-            return None
-
-    def create_pdf_from_images(image_paths, out_pdf):
-        # Prefer img2pdf for exact image-to-page conversion
-        try:
-            import img2pdf
-            with open(out_pdf, 'wb') as f:
-                f.write(img2pdf.convert(image_paths))
-            return out_pdf
-        except Exception:
-            try:
-                from PIL import Image
-                pil_imgs = []
-                for p in image_paths:
-                    try:
-                        im = Image.open(p)
-                        if im.mode == 'RGBA':
-                            im = im.convert('RGB')
-                        pil_imgs.append(im)
-                    except Exception:
-                        continue
-                if not pil_imgs:
-                    return None
-                pil_imgs[0].save(out_pdf, save_all=True, append_images=pil_imgs[1:])
-                return out_pdf
-            except Exception:
-                return None
-
-    def generate_share_story(media_root, basenames, out_dir, methods=('html', 'pptx', 'pdf')):
-        """
-        media_root: path to extracted media files (local dir)
-        basenames: list of image basenames to include (from 'media_files')
-        out_dir: directory to write outputs
-        methods: tuple of methods to attempt
-        Returns dict of generated artifact paths.
-        """
-        os.makedirs(out_dir, exist_ok=True)
-        image_paths = _find_files_by_basename(basenames, media_root)
-        results = {}
-        if not image_paths:
-            return results
-        if 'html' in methods:
-            out_html = os.path.join(out_dir, 'story_deck.html')
-            r = create_html_deck(image_paths, out_html)
-            if r:
-                results['html'] = r
-        if 'pptx' in methods:
-            out_pptx = os.path.join(out_dir, 'story_deck.pptx')
-            r = create_pptx_from_images(image_paths, out_pptx)
-            if r:
-                results['pptx'] = r
-        if 'pdf' in methods:
-            out_pdf = os.path.join(out_dir, 'story_deck.pdf')
-            r = create_pdf_from_images(image_paths, out_pdf)
-            if r:
-                results['pdf'] = r
-        return results
-
-    # Available share story options for the front-end to offer
-    share_story_options = ['html', 'pptx', 'pdf']
+                partial = analyse_part(file_info, chat.locale, seed, progress, timings)
+                counted = progress is not None
+                # A part that failed partway is not cached, so it is retried
+                if cache is not None and key is not None and partial.error is None:
+                    cache.put(key, partial)
+        pending.append((key, partial, counted))
+        drain(2 * workers if pool is not None else 0)
+    drain(0)
+    return chat
+
+def process_uploaded_data(files_data, workers=None, base=None, locale=None, seed=None, progress=None, timings=None, cache=None):
+    # Each part is aggregated on its own and merged in upload order, on top of
+    # an earlier snapshot when appending
+    chat = analyse_parts(files_data, workers, cache, base=base, locale=locale, seed=seed, progress=progress, timings=timings)
+    results = chat.finalize(timings)
+
+    # Share story formats the front-end can request from POST /story
+    share_story_options = available_formats()
+    results["stats"]["share_story_options"] = share_story_options
 
     return {
-        "stats": stats,
-        "rankings": rankings,
-        "network_data": network_data,
-        "chart_data": chart_data,
-        "media_files": sorted(list(collected_media_basenames)),
+        **results,
         "share_story_options": share_story_options,
-        # helper function available for local/testing usage; not serializable over JSON
-        "_generate_share_story": generate_share_story
+        # merged aggregates, so callers can snapshot them for later appends
+        "_chat": chat
     }
 
 if __name__ == "__main__":
-    # Simulated file data for testing
-    simulated_files_data = None
-    
-    # For local testing, you can manually set the file data here
-    # Example: simulated_files_data = [{"content": "{\"messages\":[{\"sender_name\":\"Alice\",\"content\":\"Hello Bob! 😊\",\"timestamp_ms\":1633072800000}]}}"]
-    
-    if simulated_files_data:
-        results = process_uploaded_data(simulated_files_data)
-        # For local execution, you might still want to save the results
-        with open('stats.json', 'w', encoding='utf-8') as f:
-            json.dump(results['stats'], f, indent=2, ensure_ascii=False)
-        print("Stats saved to stats.json")
-        with open('rankings.json', 'w', encoding='utf-8') as f:
-            json.dump(results['rankings'], f, indent=2, ensure_ascii=False)
-        print("Rankings saved to rankings.json")
-        with open('network_data.json', 'w', encoding='utf-8') as f:
-            json.dump(results['network_data'], f, indent=2, ensure_ascii=False)
-        print("Network data saved to network_data.json")
-        # Also write share options and media file basenames separately for UI testing
-        try:
-            with open('share_options.json', 'w', encoding='utf-8') as f:
-                json.dump({"share_story_options": results.get('share_story_options', results.get('stats', {}).get('share_story_options', []))}, f, indent=2, ensure_ascii=False)
-            print('Share options saved to share_options.json')
-        except Exception as e:
-            print(f'Error writing share_options.json: {e}')
-        
-        try:
-            with open('media_files.json', 'w', encoding='utf-8') as f:
-                json.dump({"media_files": results.get('media_files', results.get('stats', {}).get('media_files', []))}, f, indent=2, ensure_ascii=False)
-            print('Media files saved to media_files.json')
-        except Exception as e:
-            print(f'Error writing media_files.json: {e}')
+    # Batch mode: analyse export directories or zips and write each chat's
+    # stats.json, rankings.json, network_data.json, ... (see batch.py)
+    from batch import main
+    main()
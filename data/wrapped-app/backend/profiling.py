@@ -0,0 +1,161 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+# Reports of profiled analyses, one <id>.txt (plus the raw <id>.prof) each
+PROFILE_DIR = os.environ.get('WRAPPED_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles'))
+# Most recent reports kept; older ones are deleted
+PROFILE_KEEP = int(os.environ.get('WRAPPED_PROFILE_KEEP', '50'))
+# Functions and allocation sites listed in each report
+PROFILE_TOP = int(os.environ.get('WRAPPED_PROFILE_TOP', '40'))
+# Stack frames tracemalloc records per allocation
+PROFILE_FRAMES = int(os.environ.get('WRAPPED_PROFILE_FRAMES', '1'))
+# Admin token for profiling requests; profiling is off while it is unset
+ADMIN_TOKEN = os.environ.get('WRAPPED_ADMIN_TOKEN', '')
+# Profile every upload an admin makes, not just those asking for it by header
+PROFILE_UPLOADS = os.environ.get('WRAPPED_PROFILE_UPLOADS', '') not in ('', '0')
+
+_REPORT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def is_admin(token):
+    return bool(ADMIN_TOKEN) and hmac.compare_digest((token or '').encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+class NoCache:
+    """Stands in for the part cache so a profiled analysis redoes every part."""
+
+    def get(self, key):
+        return None
+
+    def put(self, key, value):
+        pass
+
+
+class Profiler:
+    """
+    Runs a call under cProfile and tracemalloc and saves a plain-text
+    report of the top functions and allocation sites.
+
+    Both hooks are process-wide, so one profiled call runs at a time and
+    others wait their turn. The raw cProfile stats are kept next to each
+    report for `python -m pstats`.
+    """
+
+    def __init__(self, root, keep=PROFILE_KEEP, top=PROFILE_TOP, frames=PROFILE_FRAMES):
+        self.root = root
+        self.keep = keep
+        self.top = top
+        self.frames = frames
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, report_id, suffix='.txt'):
+        if not _REPORT_ID_RE.match(report_id or ''):
+            raise KeyError(report_id)
+        return os.path.join(self.root, report_id + suffix)
+
+    def get(self, report_id):
+        """Text of a saved report, or None."""
+        try:
+            with open(self.path(report_id), encoding='utf-8') as f:
+                return f.read()
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def run(self, label, fn, *args, **kwargs):
+        """fn(*args, **kwargs) profiled; returns (its result, report ID)."""
+        with self._lock:
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start(self.frames)
+            tracemalloc.reset_peak()
+            profile = cProfile.Profile()
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                profile.enable()
+                try:
+                    result = fn(*args, **kwargs)
+                finally:
+                    profile.disable()
+                wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                if not was_tracing:
+                    tracemalloc.stop()
+        report_id = uuid.uuid4().hex
+        self._save(report_id, self._report(label, profile, snapshot, peak, wall, cpu), profile)
+        return result, report_id
+
+    def _report(self, label, profile, snapshot, peak, wall, cpu):
+        out = io.StringIO()
+        out.write(f"Profile of {label}\n")
+        out.write(f"Created {datetime.now(timezone.utc).isoformat(timespec='seconds')}\n")
+        out.write(f"Wall {wall:.3f}s, CPU {cpu:.3f}s, peak traced memory {peak / (1024 * 1024):.1f} MiB\n")
+
+        for order, title in (('cumulative', "cumulative time"), ('tottime', "own time")):
+            out.write(f"\n== Top {self.top} functions by {title} ==\n")
+            pstats.Stats(profile, stream=out).strip_dirs().sort_stats(order).print_stats(self.top)
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        out.write(f"\n== Top {self.top} allocation sites (live at the end of the call) ==\n")
+        for stat in snapshot.statistics('traceback' if self.frames > 1 else 'lineno')[:self.top]:
+            out.write(f"{stat.size / 1024:10.1f} KiB {stat.count:9d} blocks  {stat.traceback[0]}\n")
+            for frame in list(stat.traceback)[1:]:
+                out.write(f"{'':31}{frame}\n")
+        return out.getvalue()
+
+    def _save(self, report_id, text, profile):
+        for suffix, write in (
+            ('.prof', lambda tmp: profile.dump_stats(tmp)),
+            ('.txt', lambda tmp: _write_text(tmp, text)),
+        ):
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+            os.close(fd)
+            try:
+                write(tmp)
+                os.replace(tmp, self.path(report_id, suffix))
+            except Exception:
+                try:
+                    os.remove(tmp)
+                except FileNotFoundError:
+                    pass
+                raise
+        self._trim()
+
+    def _trim(self):
+        reports = sorted((e.stat().st_mtime, e.name[:-4]) for e in os.scandir(self.root) if e.name.endswith('.txt'))
+        for _, report_id in reports[:max(0, len(reports) - self.keep)]:
+            for suffix in ('.txt', '.prof'):
+                try:
+                    os.remove(os.path.join(self.root, report_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+_default_profiler = None
+
+
+def get_profiler():
+    global _default_profiler
+    if _default_profiler is None:
+        _default_profiler = Profiler(PROFILE_DIR)
+    return _default_profiler
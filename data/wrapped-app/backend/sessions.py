@@ -0,0 +1,132 @@
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from aggregators import STATE_VERSION
+
+# Merged aggregates of every analysed chat, so new messages can be appended
+SESSION_DIR = os.environ.get('WRAPPED_SESSION_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sessions'))
+
+# Seconds a session is kept after it was last used, and disk the snapshots may
+# take up before the least recently used ones are dropped
+SESSION_TTL = int(os.environ.get('WRAPPED_SESSION_TTL', str(7 * 24 * 3600)))
+SESSION_MAX_BYTES = int(os.environ.get('WRAPPED_SESSION_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+_SESSION_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class SessionStore:
+    """
+    On-disk snapshots of finalized ChatStats, one pickle per session ID.
+
+    Snapshots written by an older STATE_VERSION are treated as missing.
+    Sessions expire ttl seconds after they were last loaded or saved, and
+    the least recently used go first once the snapshots pass max_bytes; file
+    mtimes are the clock, as in PartCache.
+    """
+
+    def __init__(self, root, ttl=SESSION_TTL, max_bytes=SESSION_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # session_id -> [lock, holders]; entries go once nobody holds or waits
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, session_id):
+        if not _SESSION_ID_RE.match(session_id or ''):
+            raise KeyError(session_id)
+        return os.path.join(self.root, session_id + '.pkl')
+
+    @contextmanager
+    def locked(self, session_id):
+        """Serialize appends to one session within this process."""
+        with self._locks_guard:
+            entry = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[session_id]
+
+    def create(self, chat):
+        session_id = uuid.uuid4().hex
+        self.save(session_id, chat)
+        return session_id
+
+    def load(self, session_id):
+        try:
+            path = self._path(session_id)
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                self._remove(path)
+                return None
+            with open(path, 'rb') as f:
+                version, chat = pickle.load(f)
+            # Touch so the session counts as recently used
+            os.utime(path)
+        except (KeyError, FileNotFoundError):
+            return None
+        if version != STATE_VERSION:
+            return None
+        return chat
+
+    def save(self, session_id, chat):
+        path = self._path(session_id)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((STATE_VERSION, chat), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            self._remove(tmp)
+            raise
+        self._evict(keep=path)
+
+    def _evict(self, keep):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.pkl') and entry.path != keep:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        try:
+            total += os.stat(keep).st_size
+        except FileNotFoundError:
+            pass
+        expired = time.time() - self.ttl
+        # Oldest first
+        for mtime, size, path in sorted(entries):
+            if mtime >= expired and total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_default_store = None
+
+
+def get_session_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = SessionStore(SESSION_DIR)
+    return _default_store
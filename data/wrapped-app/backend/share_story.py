@@ -0,0 +1,375 @@
+import base64
+import hashlib
+import io
+import mimetypes
+import os
+import re
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from media_index import get_media_index
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Longest side, in pixels, story images are scaled down to; 0 keeps them as they are
+STORY_MAX_SIDE = int(os.environ.get('WRAPPED_STORY_MAX_SIDE', '0'))
+
+# Normalized (decoded, resized, re-encoded) story images shared by all formats
+THUMB_DIR = os.environ.get('WRAPPED_THUMB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'thumbs'))
+THUMB_MAX_BYTES = int(os.environ.get('WRAPPED_THUMB_MAX_BYTES', str(1024 * 1024 * 1024)))
+# Threads decoding and resizing images; Pillow releases the GIL while it works
+STORY_WORKERS = int(os.environ.get('WRAPPED_STORY_WORKERS', str(os.cpu_count() or 1)))
+
+# Raw bytes per base64 chunk; a multiple of 3 so chunks concatenate cleanly
+_B64_CHUNK = 3 * 256 * 1024
+
+
+def available_formats():
+    """Story formats this install can produce."""
+    formats = ['html']
+    try:
+        import pptx
+        formats.append('pptx')
+    except ImportError:
+        pass
+    if Image is not None:
+        formats.append('pdf')
+    else:
+        try:
+            import img2pdf
+            formats.append('pdf')
+        except ImportError:
+            pass
+    return formats
+
+
+def _find_files_by_basename(basenames, media_root, persist=True):
+    # Helper: find image files in a media root by basename list
+    return get_media_index().find(basenames, media_root, persist)
+
+
+def _mime(path):
+    if re.search(r'\.jpe?g$', path, flags=re.I):
+        return 'image/jpeg'
+    mime, _ = mimetypes.guess_type(path)
+    return mime if mime and mime.startswith('image/') else 'image/png'
+
+
+def _downscaled(path, max_side):
+    """
+    The image re-encoded with its longest side at most max_side, as
+    (bytes, mime), or None when it is small enough already (or can't be
+    decoded) and the file should be used as is.
+    """
+    if not max_side or Image is None:
+        return None
+    try:
+        with Image.open(path) as im:
+            if max(im.size) <= max_side:
+                return None
+            im.thumbnail((max_side, max_side))
+            buf = io.BytesIO()
+            if im.mode in ('RGBA', 'LA', 'P'):
+                im.save(buf, format='PNG')
+                return buf.getvalue(), 'image/png'
+            im.convert('RGB').save(buf, format='JPEG', quality=90)
+            return buf.getvalue(), 'image/jpeg'
+    except Exception:
+        return None
+
+
+def _write_base64(src, out):
+    # Encode in 3-byte-aligned chunks straight to the output
+    for chunk in iter(lambda: src.read(_B64_CHUNK), b''):
+        out.write(base64.b64encode(chunk).decode('ascii'))
+
+
+def create_html_deck(image_paths, out_html, max_side=None):
+    if max_side is None:
+        max_side = STORY_MAX_SIDE
+    try:
+        with open(out_html, 'w', encoding='utf-8') as out:
+            out.write('<!doctype html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1"></head><body style="margin:0;background:#000;">')
+            # One slide at a time, so only the current image is ever in memory
+            for p in image_paths:
+                try:
+                    scaled = _downscaled(p, max_side)
+                    mime = scaled[1] if scaled else _mime(p)
+                    src = io.BytesIO(scaled[0]) if scaled else open(p, 'rb')
+                    with src:
+                        out.write(f'<div style="page-break-after:always;width:100%;height:100vh;display:flex;align-items:center;justify-content:center"><img src="data:{mime};base64,')
+                        _write_base64(src, out)
+                        out.write('" style="max-width:100%;max-height:100%;"/></div>')
+                except Exception:
+                    continue
+            out.write('</body></html>')
+        return out_html
+    except Exception:
+        return None
+
+
+def create_pptx_from_images(image_paths, out_pptx, max_side=None):
+    if max_side is None:
+        max_side = STORY_MAX_SIDE
+    try:
+        from pptx import Presentation
+        from pptx.util import Inches
+    except Exception:
+        return None
+    try:
+        prs = Presentation()
+        # Use blank layout for slides
+        blank = prs.slide_layouts[6] if len(prs.slide_layouts) > 6 else prs.slide_layouts[5]
+        for img in image_paths:
+            try:
+                # python-pptx keeps picture blobs until save(), so shrink them first
+                scaled = _downscaled(img, max_side)
+                slide = prs.slides.add_slide(blank)
+                left = top = 0
+                slide.shapes.add_picture(io.BytesIO(scaled[0]) if scaled else img, left, top, width=prs.slide_width)
+            except Exception:
+                continue
+        prs.save(out_pptx)
+        return out_pptx
+    except Exception:
+        return None
+
+
+class _PdfWriter:
+    """
+    Minimal PDF writer that appends one image page at a time.
+
+    Object offsets are recorded as pages are written and the page tree and
+    cross-reference table go at the end, so nothing but the current page is
+    kept in memory. JPEGs are embedded as they are (DCTDecode); anything else
+    is stored losslessly (FlateDecode).
+    """
+
+    _CATALOG = 1
+    _PAGES = 2
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 3
+        f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.f.tell()
+        self.f.write(f'{obj_id} 0 obj\n'.encode('ascii'))
+        self.f.write(body.encode('ascii'))
+        if stream is not None:
+            self.f.write(b'\nstream\n')
+            self.f.write(stream)
+            self.f.write(b'\nendstream')
+        self.f.write(b'\nendobj\n')
+
+    def add_page(self, data, width, height, colorspace, filter_name):
+        image_id, contents_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        self._object(image_id, f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /{colorspace} /BitsPerComponent 8 /Filter /{filter_name} /Length {len(data)} >>', data)
+        contents = f'q {width} 0 0 {height} 0 0 cm /Im0 Do Q'.encode('ascii')
+        self._object(contents_id, f'<< /Length {len(contents)} >>', contents)
+        self._object(page_id, f'<< /Type /Page /Parent {self._PAGES} 0 R /MediaBox [0 0 {width} {height}] /Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {contents_id} 0 R >>')
+        self.pages.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f'{p} 0 R' for p in self.pages)
+        self._object(self._PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>')
+        self._object(self._CATALOG, f'<< /Type /Catalog /Pages {self._PAGES} 0 R >>')
+        xref = self.f.tell()
+        self.f.write(f'xref\n0 {self.next_id}\n0000000000 65535 f \n'.encode('ascii'))
+        for obj_id in range(1, self.next_id):
+            self.f.write(f'{self.offsets[obj_id]:010d} 00000 n \n'.encode('ascii'))
+        self.f.write(f'trailer\n<< /Size {self.next_id} /Root {self._CATALOG} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('ascii'))
+
+
+def _pdf_page(path, max_side):
+    """(data, width, height, colorspace, filter) for one image, decoded at most once."""
+    with Image.open(path) as im:
+        if im.format == 'JPEG' and im.mode in ('RGB', 'L') and not (max_side and max(im.size) > max_side):
+            with open(path, 'rb') as f:
+                data = f.read()
+            return data, im.width, im.height, 'DeviceGray' if im.mode == 'L' else 'DeviceRGB', 'DCTDecode'
+        if max_side:
+            im.thumbnail((max_side, max_side))
+        im = im.convert('L' if im.mode in ('L', '1') else 'RGB')
+        return zlib.compress(im.tobytes()), im.width, im.height, 'DeviceGray' if im.mode == 'L' else 'DeviceRGB', 'FlateDecode'
+
+
+def create_pdf_from_images(image_paths, out_pdf, max_side=None):
+    if max_side is None:
+        max_side = STORY_MAX_SIDE
+    if Image is None:
+        # img2pdf converts exactly, but holds the whole document in memory
+        try:
+            import img2pdf
+            with open(out_pdf, 'wb') as f:
+                img2pdf.convert(image_paths, outputstream=f)
+            return out_pdf
+        except Exception:
+            return None
+    try:
+        with open(out_pdf, 'wb') as f:
+            writer = _PdfWriter(f)
+            for p in image_paths:
+                try:
+                    writer.add_page(*_pdf_page(p, max_side))
+                except Exception:
+                    continue
+            if writer.pages:
+                writer.close()
+        if not writer.pages:
+            os.remove(out_pdf)
+            return None
+        return out_pdf
+    except Exception:
+        return None
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _thumb_path(path, max_side, thumb_dir, digest=None):
+    # Keyed by content, so the same image staged into another directory
+    # (every POST /story stages afresh) still hits the cache
+    if digest is None:
+        digest = _file_digest(path)
+    key = hashlib.sha256(f'{digest}:{max_side}'.encode('utf-8')).hexdigest()
+    return os.path.join(thumb_dir, key + '.jpg')
+
+
+def normalize_image(path, max_side, thumb_dir, digest=None):
+    """
+    Decode and resize an image once into the shared thumbnail cache.
+
+    Returns a path every writer can use without decoding again: the original
+    file if it is already an RGB/greyscale JPEG within max_side, otherwise a
+    cached JPEG (transparency flattened onto the deck's black background).
+    Returns None for files that aren't images. Cached entries are keyed by
+    the file's SHA-256 (digest, if the caller already has it) and max_side,
+    so regenerating a story reuses them.
+    """
+    try:
+        thumb = _thumb_path(path, max_side, thumb_dir, digest)
+        if os.path.exists(thumb):
+            os.utime(thumb)
+            return thumb
+        with Image.open(path) as im:
+            if im.format == 'JPEG' and im.mode in ('RGB', 'L') and not (max_side and max(im.size) > max_side):
+                return path
+            if max_side:
+                im.thumbnail((max_side, max_side))
+            if im.mode in ('RGBA', 'LA', 'P', 'PA'):
+                im = im.convert('RGBA')
+                flat = Image.new('RGB', im.size, (0, 0, 0))
+                flat.paste(im, mask=im.getchannel('A'))
+                im = flat
+            elif im.mode != 'L':
+                im = im.convert('RGB')
+            fd, tmp = tempfile.mkstemp(dir=thumb_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    im.save(f, format='JPEG', quality=90)
+                os.replace(tmp, thumb)
+            except Exception:
+                os.remove(tmp)
+                raise
+        return thumb
+    except Exception:
+        return None
+
+
+def _trim_thumbs(thumb_dir, max_bytes):
+    # Least recently used thumbnails go first once the cache is over its cap
+    entries = []
+    for entry in os.scandir(thumb_dir):
+        if entry.name.endswith('.jpg'):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def normalize_images(image_paths, max_side=None, thumb_dir=None, workers=None, digests=None):
+    """
+    normalize_image over image_paths on a thread pool, in order, dropping
+    non-images. digests optionally maps basenames to known SHA-256s.
+    """
+    if max_side is None:
+        max_side = STORY_MAX_SIDE
+    thumb_dir = thumb_dir or THUMB_DIR
+    digests = digests or {}
+    os.makedirs(thumb_dir, exist_ok=True)
+
+    def normalize(p):
+        return normalize_image(p, max_side, thumb_dir, digests.get(os.path.basename(p)))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers or STORY_WORKERS)) as pool:
+        paths = [p for p in pool.map(normalize, image_paths) if p]
+    _trim_thumbs(thumb_dir, THUMB_MAX_BYTES)
+    return paths
+
+
+def generate_share_story(media_root, basenames, out_dir, methods=('html', 'pptx', 'pdf'), max_side=None, digests=None,
+                         persist_index=True):
+    """
+    media_root: path to extracted media files (local dir)
+    basenames: list of image basenames to include (from 'media_files')
+    out_dir: directory to write outputs
+    methods: tuple of methods to attempt
+    max_side: downscale images to this longest side (default WRAPPED_STORY_MAX_SIDE)
+    digests: optional basename -> SHA-256 of the files, if already known
+    persist_index: keep media_root's index for later runs; False for
+        directories that are deleted afterwards
+    Returns dict of generated artifact paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    image_paths = _find_files_by_basename(basenames, media_root, persist_index)
+    results = {}
+    if not image_paths:
+        return results
+    if Image is not None:
+        # Decode and resize each image once; the writers then only copy bytes
+        image_paths = normalize_images(image_paths, max_side, digests=digests)
+        max_side = 0
+        if not image_paths:
+            return results
+
+    writers = {
+        'html': (create_html_deck, 'story_deck.html'),
+        'pptx': (create_pptx_from_images, 'story_deck.pptx'),
+        'pdf': (create_pdf_from_images, 'story_deck.pdf'),
+    }
+    wanted = [m for m in ('html', 'pptx', 'pdf') if m in methods]
+    # The formats are independent, so build them side by side
+    with ThreadPoolExecutor(max_workers=max(1, len(wanted))) as pool:
+        futures = {
+            m: pool.submit(writers[m][0], image_paths, os.path.join(out_dir, writers[m][1]), max_side)
+            for m in wanted
+        }
+    for m in wanted:
+        r = futures[m].result()
+        if r:
+            results[m] = r
+    return results
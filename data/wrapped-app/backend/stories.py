@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+# Generated share-story decks, one directory per media set
+STORY_DIR = os.environ.get('WRAPPED_STORY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stories'))
+STORY_MAX_BYTES = int(os.environ.get('WRAPPED_STORY_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+STORY_FORMATS = ('html', 'pptx', 'pdf')
+STORY_MEDIA_TYPES = {
+    'html': 'text/html',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'pdf': 'application/pdf',
+}
+
+_STORY_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+_HASH_CHUNK = 1024 * 1024
+
+
+def stage_media(openers, basenames, media_dir, salt=''):
+    """
+    Copy the chosen media into media_dir and derive the story ID from it.
+
+    openers maps basename -> zero-argument opener (see archives.upload_media);
+    basenames picks and orders the images, defaulting to every opener. The
+    ID is a SHA-256 over salt and each staged file's name and content, so
+    the same media set always maps to the same story. Returns
+    (story_id, staged basenames, {basename: SHA-256 of its content}).
+    """
+    if basenames is None:
+        basenames = list(openers)
+    story = hashlib.sha256(f'story:{salt}:'.encode('utf-8'))
+    staged = []
+    digests = {}
+    for name in basenames:
+        # Only plain file names: '', '.' and '..' would resolve to a directory
+        if name in staged or name not in openers or name in ('', '.', '..') or os.path.basename(name) != name:
+            continue
+        h = hashlib.sha256()
+        with openers[name]() as src, open(os.path.join(media_dir, name), 'wb') as dst:
+            for chunk in iter(lambda: src.read(_HASH_CHUNK), b''):
+                h.update(chunk)
+                dst.write(chunk)
+        story.update(f'{name}:{h.hexdigest()};'.encode('utf-8'))
+        staged.append(name)
+        digests[name] = h.hexdigest()
+    return story.hexdigest(), staged, digests
+
+
+class StoryStore:
+    """
+    Artifact cache of generated decks, keyed by media set and format.
+
+    Each story ID is a directory holding story_deck.<fmt> files. Decks are
+    published with os.replace so readers never see a partial file, and
+    whole stories are evicted least-recently-served past max_bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._running = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, story_id, fmt):
+        if not _STORY_ID_RE.match(story_id or '') or fmt not in STORY_FORMATS:
+            raise KeyError(story_id)
+        return os.path.join(self.root, story_id, f'story_deck.{fmt}')
+
+    def get(self, story_id, fmt):
+        """Path of a generated deck, or None."""
+        try:
+            path = self.path(story_id, fmt)
+        except KeyError:
+            return None
+        if not os.path.exists(path):
+            return None
+        # Touch so the story counts as recently used
+        os.utime(os.path.dirname(path))
+        return path
+
+    def missing(self, story_id, formats):
+        return [fmt for fmt in formats if not os.path.exists(self.path(story_id, fmt))]
+
+    def claim(self, story_id, formats, start):
+        """
+        {fmt: job ID} of the jobs building these formats of story_id. Formats
+        no job is building yet are passed to start(formats), which launches
+        one job for them and returns its ID.
+        """
+        with self._lock:
+            unclaimed = [fmt for fmt in formats if (story_id, fmt) not in self._running]
+            if unclaimed:
+                job_id = start(unclaimed)
+                for fmt in unclaimed:
+                    self._running[(story_id, fmt)] = job_id
+            return {fmt: self._running[(story_id, fmt)] for fmt in formats}
+
+    def publish(self, story_id, artifacts):
+        """Move generated {fmt: path} decks into the cache."""
+        os.makedirs(os.path.join(self.root, story_id), exist_ok=True)
+        for fmt, path in artifacts.items():
+            os.replace(path, self.path(story_id, fmt))
+        self._evict(keep=story_id)
+
+    def release(self, story_id, formats):
+        """Forget the claims on formats of story_id once their job has finished."""
+        with self._lock:
+            for fmt in formats:
+                self._running.pop((story_id, fmt), None)
+
+    def _evict(self, keep):
+        stories = []
+        for entry in os.scandir(self.root):
+            # Skip the story just published and in-progress scratch directories
+            if not entry.is_dir() or entry.name == keep or entry.name.startswith('.'):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            stories.append((entry.stat().st_mtime, size, entry.path))
+        total = sum(size for _, size, _ in stories)
+        keep_dir = os.path.join(self.root, keep)
+        if os.path.isdir(keep_dir):
+            total += sum(f.stat().st_size for f in os.scandir(keep_dir) if f.is_file())
+        # Oldest first
+        for _, size, path in sorted(stories):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def workdir(self):
+        """Scratch directory for one generation, on the same filesystem as the cache."""
+        return tempfile.mkdtemp(dir=self.root, prefix='.work-')
+
+
+_default_store = None
+
+
+def get_story_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = StoryStore(STORY_DIR, STORY_MAX_BYTES)
+    return _default_store
@@ -0,0 +1,161 @@
+"""
+Deterministic synthetic Instagram chat exports, for benchmarks.
+
+    python synth_export.py OUT_DIR --messages 100000 --participants 12
+
+writes OUT_DIR/message_1.json, message_2.json, ... shaped like a real export:
+newest messages first, 10,000 per file, and non-ASCII text stored as the
+latin-1 mojibake Instagram produces. The same arguments always give
+byte-identical files.
+"""
+import argparse
+import json
+import os
+import random
+
+_WORDS = (
+    "the i you to a and it is that so my of in lol bro wait like what this for "
+    "was just on me no yeah not be we do have but are they it's can all with "
+    "bruh omg fr ngl tbh lmao dude literally actually honestly crazy insane "
+    "tomorrow tonight today class exam finals library coffee pizza ramen boba "
+    "game match movie show episode season trailer ticket concert party beach "
+    "dog cat car bus train flight airport hotel city campus dorm room roommate "
+    "good bad great nice cool funny weird cursed based mid fire goated sus "
+    "going coming leaving eating sleeping studying working playing watching "
+    "why when where who how because maybe probably definitely never always "
+    "fuck shit damn hell ass bitch fucking shitty damnit "
+    "dont cant wont im youre theyre thats whats isnt didnt doesnt "
+    "supercalifragilistic antidisestablishmentarianism pneumonoultramicroscopic"
+).split()
+_EMOJI = ('\U0001f602', '❤', '\U0001f525', '\U0001f62d', '\U0001f44d', '\U0001f64f', '\U0001f480')
+_ACCENTED = ('café', 'niño', 'über', 'jalapeño', 'naïve', 'señor', 'crème')
+_REACTIONS = ('❤', '\U0001f602', '\U0001f62e', '\U0001f622', '\U0001f44d', '\U0001f525')
+_FIRST_NAMES = ('Alex', 'Bea', 'Chris', 'Dana', 'Eli', 'Fran', 'Gus', 'Hana', 'Ivan', 'Jo', 'Kai', 'Lena')
+
+MESSAGES_PER_FILE = 10000
+# Newest message in the export; older messages count back from here
+END_TIMESTAMP_MS = 1765436538683
+
+
+def mojibake(text):
+    """UTF-8 text as an Instagram export stores it (each byte as a latin-1 char)."""
+    return text.encode('utf-8').decode('latin-1')
+
+
+def participant_names(count):
+    names = []
+    for i in range(count):
+        name = f"{_FIRST_NAMES[i % len(_FIRST_NAMES)]} {i}"
+        # Some non-ASCII names, which exports always mangle
+        if i % 4 == 3:
+            name = f"José {i} ✨"
+        names.append(name)
+    return names
+
+
+def _text(rng, mojibake_rate):
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(1, 25))]
+    if rng.random() < 0.03:
+        words.append(f"https://example.com/{rng.randrange(10 ** 6)}")
+    if rng.random() < mojibake_rate:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(_EMOJI + _ACCENTED))
+    return mojibake(' '.join(words))
+
+
+def iter_messages(messages, participants, reaction_density, media_ratio, mojibake_rate, thread, seed):
+    """Yield message dicts newest first."""
+    rng = random.Random(seed)
+    names = participant_names(participants)
+    senders = [mojibake(n) for n in names]
+    # Zipf-like activity: a few people send most messages
+    weights = [1.0 / (i + 1) for i in range(participants)]
+    # Geometric reaction counts with mean reaction_density
+    p_react = reaction_density / (1.0 + reaction_density)
+    timestamp = END_TIMESTAMP_MS
+
+    for _ in range(messages):
+        i = rng.choices(range(participants), weights)[0]
+        message = {"sender_name": senders[i], "timestamp_ms": timestamp}
+
+        roll = rng.random()
+        if roll < media_ratio:
+            kind, ext = rng.choice((('photos', 'jpg'), ('photos', 'jpg'), ('photos', 'png'), ('videos', 'mp4'), ('audio', 'mp4')))
+            key = 'audio_files' if kind == 'audio' else kind
+            media_id = rng.randrange(10 ** 15, 10 ** 16)
+            message[key] = [{"uri": f"your_instagram_activity/messages/inbox/{thread}/{kind}/{media_id}.{ext}", "creation_timestamp": timestamp // 1000}]
+        elif roll < media_ratio + 0.05:
+            message["content"] = f"{senders[i]} sent an attachment."
+            message["share"] = {"link": f"https://www.instagram.com/reel/{rng.randrange(10 ** 12):x}/", "share_text": _text(rng, mojibake_rate)}
+        else:
+            message["content"] = _text(rng, mojibake_rate)
+
+        reactions = 0
+        while reactions < participants - 1 and rng.random() < p_react:
+            reactions += 1
+        if reactions:
+            others = [j for j in range(participants) if j != i]
+            message["reactions"] = [
+                {"reaction": mojibake(rng.choice(_REACTIONS)), "actor": senders[j]}
+                for j in rng.sample(others, reactions)
+            ]
+
+        message["is_geoblocked_for_viewer"] = False
+        yield message
+        timestamp -= int(rng.expovariate(1 / 120000)) + 1
+
+
+def generate_export(out_dir, messages=100000, participants=12, reaction_density=0.4, media_ratio=0.05,
+                    mojibake_rate=0.1, messages_per_file=MESSAGES_PER_FILE, seed=0):
+    """
+    Write a synthetic export into out_dir and return the message file paths,
+    message_1.json (newest) first. Only one file's messages are held at once.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    thread = f"synthetic_{seed}"
+    names = participant_names(participants)
+    header = {
+        "participants": [{"name": mojibake(n)} for n in names],
+        "title": mojibake(f"Synthetic chat ✨ {seed}"),
+        "is_still_participant": True,
+        "thread_path": f"inbox/{thread}",
+        "magic_words": [],
+    }
+
+    paths = []
+    chunk = []
+
+    def flush():
+        path = os.path.join(out_dir, f"message_{len(paths) + 1}.json")
+        with open(path, 'w', encoding='ascii') as f:
+            json.dump({**header, "messages": chunk}, f, indent=2)
+        paths.append(path)
+        chunk.clear()
+
+    for message in iter_messages(messages, participants, reaction_density, media_ratio, mojibake_rate, thread, seed):
+        chunk.append(message)
+        if len(chunk) >= messages_per_file:
+            flush()
+    if chunk or not paths:
+        flush()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic Instagram chat export.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--participants', type=int, default=12)
+    parser.add_argument('--reaction-density', type=float, default=0.4, help="mean reactions per message")
+    parser.add_argument('--media-ratio', type=float, default=0.05, help="share of messages that are photos/videos/audio")
+    parser.add_argument('--mojibake-rate', type=float, default=0.1, help="share of texts with emoji/accents (stored as mojibake)")
+    parser.add_argument('--messages-per-file', type=int, default=MESSAGES_PER_FILE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_export(args.out_dir, args.messages, args.participants, args.reaction_density,
+                            args.media_ratio, args.mojibake_rate, args.messages_per_file, args.seed)
+    print(f"Wrote {args.messages} messages to {len(paths)} files in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import admission
+from admission import Admission, AdmissionError
+
+
+def _admission(**kwargs):
+    settings = dict(workers=1, max_queued=1, max_bytes=1000, max_files=3, max_file_bytes=500, retry_after=7)
+    settings.update(kwargs)
+    return Admission(**settings)
+
+
+def test_oversized_requests_get_413():
+    adm = _admission()
+    for sizes in ([1, 1, 1, 1], [501], [400, 400, 400]):
+        with pytest.raises(AdmissionError) as e:
+            adm.admit(sizes)
+        assert e.value.status_code == 413
+        assert e.value.retry_after is None
+    assert adm.stats()["rejected"] == 0
+
+
+def test_busy_service_gets_429_until_released():
+    adm = _admission()
+    first = adm.admit([100])
+    second = adm.admit([100])
+    assert adm.stats()["running"] == 1
+    assert adm.stats()["queued"] == 1
+    with pytest.raises(AdmissionError) as e:
+        adm.admit([100])
+    assert e.value.status_code == 429
+    assert e.value.retry_after == 7
+    first()
+    first()
+    adm.admit([100])
+    second()
+    stats = adm.stats()
+    assert stats["rejected"] == 1
+    assert stats["in_flight_bytes"] == 100
+
+
+def test_in_flight_bytes_are_bounded():
+    adm = _admission(max_queued=5)
+    adm.admit([450, 450])
+    with pytest.raises(AdmissionError) as e:
+        adm.admit([200])
+    assert e.value.status_code == 429
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    adm = _admission(max_queued=0, max_bytes=10_000, max_file_bytes=5_000)
+    monkeypatch.setattr(admission, '_default_admission', adm)
+    return TestClient(app), adm
+
+
+def _upload(client, body):
+    return client.post('/upload', files=[('files', ('message_1.json', body, 'application/json'))])
+
+
+def test_upload_is_turned_away(client):
+    client, adm = client
+    messages = json.dumps({"messages": [{"sender_name": "ana", "timestamp_ms": 1700000000000, "content": "hi"}]})
+    too_big = _upload(client, messages + ' ' * 6000)
+    assert too_big.status_code == 413
+
+    release = adm.admit([1])
+    busy = _upload(client, messages)
+    assert busy.status_code == 429
+    assert busy.headers['retry-after'] == '7'
+    release()
+    assert _upload(client, messages).status_code == 200
+    assert adm.stats()["in_flight_bytes"] == 0
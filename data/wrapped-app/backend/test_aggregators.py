@@ -0,0 +1,28 @@
+import pytest
+
+import aggregators
+from aggregators import ChatStats
+
+
+def test_numpy_timeline_matches_python_fallback(parts, analyse, comparable, monkeypatch):
+    if aggregators.np is None:
+        pytest.skip("numpy not installed")
+    with_numpy = analyse(parts)
+    monkeypatch.setattr(aggregators, 'np', None)
+    assert comparable(analyse(parts)) == comparable(with_numpy)
+
+
+def test_float_timestamps_are_counted():
+    chat = ChatStats()
+    chat.update({"sender_name": "ana", "timestamp_ms": 1700000000000.0, "content": "hi"})
+    chat.update({"sender_name": "ben", "timestamp_ms": 1700000060000.7, "content": "hello"})
+    assert list(chat.timeline.table.timestamps) == [1700000000000, 1700000060000]
+
+
+def test_unusable_timestamps_only_skip_the_timeline():
+    chat = ChatStats()
+    for ts in (None, "soon", 2 ** 70, float('nan'), 1700000000000):
+        chat.update({"sender_name": "ana", "timestamp_ms": ts, "content": "hi"})
+    assert list(chat.timeline.table.timestamps) == [1700000000000]
+    assert chat.messages_sent.counts["ana"] == 5
+    chat.finalize()
@@ -0,0 +1,74 @@
+import gzip
+import io
+import json
+import zipfile
+
+import pytest
+
+from archives import upload_media, upload_parts, zip_threads
+from process_data import iter_messages
+
+
+def _part(*contents):
+    return json.dumps({
+        "participants": [{"name": "ana"}],
+        "messages": [{"sender_name": "ana", "timestamp_ms": 1700000000000 + i, "content": c} for i, c in enumerate(contents)],
+    }).encode('utf-8')
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def _contents(part):
+    return [m["content"] for m in iter_messages(part)]
+
+
+def test_zip_parts_come_in_message_order():
+    export = _zip({
+        'your_activity/messages/inbox/chat_1/message_10.json': _part("ten"),
+        'your_activity/messages/inbox/chat_1/message_2.json': _part("two"),
+        'your_activity/messages/inbox/chat_1/message_1.json': _part("one"),
+        'your_activity/messages/inbox/chat_1/photos/a.jpg': b'jpeg',
+        'your_activity/other/notes.json': b'{}',
+    })
+    parts, media = upload_parts('export.zip', export)
+    assert [_contents(p) for p in parts] == [["one"], ["two"], ["ten"]]
+    assert parts[0]["size"] == len(_part("one"))
+    assert media == {'a.jpg': 'your_activity/messages/inbox/chat_1/photos/a.jpg'}
+
+
+def test_thread_picks_one_conversation():
+    export = _zip({
+        'messages/inbox/chat_1/message_1.json': _part("first chat"),
+        'messages/inbox/chat_2/message_1.json': _part("second chat"),
+        'messages/inbox/chat_2/videos/v.mp4': b'mp4',
+    })
+    assert zip_threads(export) == ['chat_1', 'chat_2']
+    with pytest.raises(ValueError, match='chat_1, chat_2'):
+        upload_parts('export.zip', export)
+    with pytest.raises(ValueError, match='not found'):
+        upload_parts('export.zip', export, 'chat_3')
+    parts, media = upload_parts('export.zip', export, 'chat_2')
+    assert [_contents(p) for p in parts] == [["second chat"]]
+    assert list(media) == ['v.mp4']
+    assert list(upload_media('export.zip', export, 'chat_2')) == ['v.mp4']
+
+
+def test_gzip_part_is_read_in_place():
+    data = _part("zipped", "twice")
+    parts, media = upload_parts('message_1.json.gz', io.BytesIO(gzip.compress(data)))
+    assert [_contents(p) for p in parts] == [["zipped", "twice"]]
+    assert parts[0]["size"] == len(data)
+    assert media == {}
+
+
+def test_plain_json_and_other_files():
+    parts, _ = upload_parts('message_1.json', io.BytesIO(_part("plain")))
+    assert [_contents(p) for p in parts] == [["plain"]]
+    assert upload_parts('photo.jpg', io.BytesIO(b'\xff\xd8jpeg')) == ([], {})
@@ -0,0 +1,25 @@
+import json
+import os
+
+from batch import _dir_name, find_chats
+
+
+def _write_chat(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'message_1.json'), 'w') as f:
+        json.dump({"messages": [{"sender_name": "ana", "timestamp_ms": 1700000000000, "content": "hi"}]}, f)
+
+
+def test_dir_names_never_collapse():
+    assert _dir_name('/') == 'chat'
+    assert _dir_name('/exports/ana_ben/') == 'ana_ben'
+    assert _dir_name('/exports/ana_ben/sub/..') == 'ana_ben'
+
+
+def test_chats_are_named_after_their_directory(tmp_path, monkeypatch):
+    _write_chat(tmp_path / 'ana_ben')
+    _write_chat(tmp_path / 'ana_ben' / 'older')
+    _write_chat(tmp_path / '.hidden')
+    monkeypatch.chdir(tmp_path / 'ana_ben')
+    names = [chat["name"] for chat in find_chats(['.', str(tmp_path / 'ana_ben') + os.sep, str(tmp_path / '.hidden')])]
+    assert names == ['ana_ben', 'older', 'ana_ben-2', 'older-2', 'chat.hidden']
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+import network
+from network import build_network_data, pair_likes
+
+
+def _chat(n=12, seed=3):
+    rng = random.Random(seed)
+    people = [f"p{i:02d}" for i in range(n)]
+    matrix = {a: {b: rng.randrange(0, 5) for b in people if rng.random() < 0.6} for a in people}
+    given = {p: sum(matrix[p].values()) for p in people}
+    return people, matrix, given
+
+
+def _reference_strengths(links):
+    # The original thresholds: sort every ratio and index the tertiles
+    ratios = sorted(link["ratio"] for link in links)
+    low, med = ratios[len(ratios) // 3], ratios[(2 * len(ratios)) // 3]
+    return ["Low" if r <= low else "Medium" if r <= med else "High" for r in (link["ratio"] for link in links)]
+
+
+def test_pair_likes_skips_self_and_outsiders():
+    matrix = {"ana": {"ana": 4, "ben": 2, "zed": 9}, "ben": {"ana": 1}, "zed": {"ana": 5}}
+    assert pair_likes(["ana", "ben"], matrix) == {("ana", "ben"): 3}
+
+
+@pytest.mark.parametrize('with_numpy', [True, False])
+def test_tertiles_match_a_full_sort(with_numpy, monkeypatch):
+    if not with_numpy:
+        monkeypatch.setattr(network, 'np', None)
+    elif network.np is None:
+        pytest.skip("numpy not installed")
+    people, matrix, given = _chat()
+    links = build_network_data(people, matrix, given, max_links=0)["links"]
+    assert links
+    assert [link["strength"] for link in links] == _reference_strengths(links)
+    assert [(link["source"], link["target"]) for link in links] == sorted((link["source"], link["target"]) for link in links)
+
+
+def test_max_links_keeps_the_strongest_in_order():
+    people, matrix, given = _chat()
+    everything = build_network_data(people, matrix, given, max_links=0)
+    capped = build_network_data(people, matrix, given, max_links=5)
+    assert capped["nodes"] == everything["nodes"]
+    assert len(capped["links"]) == 5
+    weakest_kept = min(link["value"] for link in capped["links"])
+    assert all(link["value"] <= weakest_kept for link in everything["links"] if link not in capped["links"])
+    positions = [everything["links"].index(link) for link in capped["links"]]
+    assert positions == sorted(positions)
@@ -0,0 +1,75 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from payloads import etag_matches, input_etag
+
+
+def _export(media=()):
+    # A one-conversation export zip with a few messages and the given media
+    messages = {
+        "participants": [{"name": "ana"}, {"name": "ben"}],
+        "messages": [
+            {"sender_name": "ben", "timestamp_ms": 1700000060000, "content": "hello there"},
+            {"sender_name": "ana", "timestamp_ms": 1700000000000, "content": "hi ben"},
+        ],
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('messages/inbox/chat_1/message_1.json', json.dumps(messages))
+        for name in media:
+            zf.writestr(f'messages/inbox/chat_1/photos/{name}', b'\xff\xd8 not really a jpeg')
+    return buf.getvalue()
+
+
+@pytest.fixture(scope='module')
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+    return TestClient(app)
+
+
+def _upload(client, body, headers=None):
+    return client.post('/upload', files=[('files', ('export.zip', body, 'application/zip'))], headers=headers or {})
+
+
+def test_input_etag_depends_on_order_repeats_and_variant():
+    tag = input_etag(['a', 'b'], 'en')
+    assert tag.startswith('W/"')
+    assert input_etag(['a', 'b'], 'en') == tag
+    assert input_etag(['b', 'a'], 'en') != tag
+    assert input_etag(['a', 'b', 'b'], 'en') != tag
+    assert input_etag(['a', 'b'], 'de') != tag
+    assert input_etag(['a', None], 'en') is None
+    assert input_etag([], 'en') is None
+
+
+def test_etag_matches_compares_weakly():
+    assert etag_matches('W/"abc"', 'W/"abc"')
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert etag_matches('"x", W/"abc"', 'W/"abc"')
+    assert etag_matches('*', 'W/"abc"')
+    assert not etag_matches('W/"abd"', 'W/"abc"')
+    assert not etag_matches(None, 'W/"abc"')
+    assert not etag_matches('*', None)
+
+
+def test_unchanged_upload_gets_304(client):
+    first = _upload(client, _export())
+    assert first.status_code == 200
+    etag = first.headers['etag']
+    again = _upload(client, _export(), {'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['etag'] == etag
+    assert again.content == b''
+
+
+def test_archive_media_changes_etag(client):
+    plain = _upload(client, _export()).headers['etag']
+    with_photo = _upload(client, _export(['a.jpg'])).headers['etag']
+    other_photo = _upload(client, _export(['b.jpg']))
+    assert len({plain, with_photo, other_photo.headers['etag']}) == 3
+    # The tag of another media set doesn't validate this one
+    assert _upload(client, _export(['b.jpg']), {'If-None-Match': with_photo}).status_code == 200
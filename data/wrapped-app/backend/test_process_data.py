@@ -0,0 +1,51 @@
+import io
+import json
+import threading
+
+import process_data
+from aggregators import ChatStats
+from part_cache import PartCache
+from process_data import analyse_part, analyse_parts, iter_messages
+from profiling import NoCache
+
+
+def test_merged_partials_match_single_pass(parts, comparable):
+    single = ChatStats()
+    for part in parts:
+        for message in iter_messages(part):
+            single.update(message)
+    merged = analyse_parts(parts, workers=0, cache=NoCache())
+    assert comparable(merged.finalize()) == comparable(single.finalize())
+
+
+def test_concurrent_callers_share_one_pool():
+    pools = []
+    callers = [threading.Thread(target=lambda: pools.append(process_data._get_pool(2))) for _ in range(8)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    assert len({id(pool) for pool in pools}) == 1
+    # Another size gets its own pool; the first one keeps working
+    assert process_data._get_pool(3) is not pools[0]
+    assert pools[0].submit(sum, [1, 2]).result() == 3
+
+
+def test_pool_matches_in_process(parts, comparable):
+    in_process = analyse_parts(parts, workers=0, cache=NoCache())
+    pooled = analyse_parts(parts, workers=2, cache=NoCache())
+    assert comparable(pooled.finalize()) == comparable(in_process.finalize())
+
+
+def test_parts_that_fail_partway_are_not_cached(tmp_path):
+    messages = [{"sender_name": "ana", "timestamp_ms": 1700000000000 + i, "content": f"message {i}"} for i in range(50)]
+    body = json.dumps({"messages": messages}).encode('utf-8')
+    truncated = body[:len(body) // 2]
+    partial = analyse_part({"stream": io.BytesIO(truncated)})
+    assert partial.error
+    assert analyse_part({"stream": io.BytesIO(body)}).error is None
+
+    cache = PartCache(str(tmp_path), 10 * 1024 * 1024)
+    for data in (body, truncated):
+        analyse_parts([{"filename": "message_1.json", "stream": io.BytesIO(data)}], workers=0, cache=cache)
+    assert cache.stats()["entries"] == 1
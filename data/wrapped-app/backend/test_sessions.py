@@ -0,0 +1,88 @@
+import os
+import pickle
+import threading
+import time
+
+from sessions import SessionStore
+
+
+def _age(store, session_id, seconds):
+    path = store._path(session_id)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_append_matches_full_upload(parts, analyse, comparable):
+    half = len(parts) // 2
+    # Sessions keep the merged aggregates pickled between requests
+    base = pickle.loads(pickle.dumps(analyse(parts[:half])["_chat"]))
+    appended = analyse(parts[half:], base=base)
+    assert comparable(appended) == comparable(analyse(parts))
+
+
+def test_round_trip(tmp_path):
+    store = SessionStore(str(tmp_path))
+    session_id = store.create({"messages": 3})
+    assert store.load(session_id) == {"messages": 3}
+    assert store.load('0' * 32) is None
+    assert store.load('../etc/passwd') is None
+
+
+def test_sessions_expire_after_ttl(tmp_path):
+    store = SessionStore(str(tmp_path), ttl=60)
+    session_id = store.create("chat")
+    _age(store, session_id, 120)
+    assert store.load(session_id) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_loading_keeps_a_session_alive(tmp_path):
+    store = SessionStore(str(tmp_path), ttl=60)
+    session_id = store.create("chat")
+    _age(store, session_id, 50)
+    assert store.load(session_id) == "chat"
+    assert time.time() - os.stat(store._path(session_id)).st_mtime < 10
+
+
+def test_least_recently_used_go_past_max_bytes(tmp_path):
+    store = SessionStore(str(tmp_path), max_bytes=10_000)
+    first = store.create(b'x' * 4000)
+    second = store.create(b'x' * 4000)
+    _age(store, first, 30)
+    _age(store, second, 20)
+    # Using the first session makes the second the least recently used
+    store.load(first)
+    third = store.create(b'x' * 4000)
+    assert store.load(second) is None
+    assert store.load(first) is not None
+    assert store.load(third) is not None
+
+
+def test_expired_sessions_are_swept_on_save(tmp_path):
+    store = SessionStore(str(tmp_path), ttl=60)
+    stale = store.create("old")
+    _age(store, stale, 120)
+    store.create("new")
+    assert not os.path.exists(store._path(stale))
+
+
+def test_lock_entries_are_dropped(tmp_path):
+    store = SessionStore(str(tmp_path))
+    session_id = store.create("chat")
+    inside = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with store.locked(session_id):
+            inside.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    inside.wait()
+    assert session_id in store._locks
+    release.set()
+    holder.join()
+    with store.locked(session_id):
+        pass
+    assert store._locks == {}
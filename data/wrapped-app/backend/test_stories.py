@@ -0,0 +1,97 @@
+import io
+import os
+import time
+
+import pytest
+
+from stories import StoryStore, stage_media
+
+
+def _openers(files):
+    return {name: (lambda data=data: io.BytesIO(data)) for name, data in files.items()}
+
+
+def test_stage_media_ids_follow_content(tmp_path):
+    first, second = tmp_path / 'one', tmp_path / 'two'
+    first.mkdir()
+    second.mkdir()
+    story_id, staged, digests = stage_media(_openers({"a.png": b'aaa', "b.png": b'bbb'}), None, str(first))
+    assert staged == ["a.png", "b.png"]
+    assert stage_media(_openers({"a.png": b'aaa', "b.png": b'bbb'}), None, str(second))[0] == story_id
+    assert stage_media(_openers({"a.png": b'aaa', "b.png": b'ccc'}), None, str(second))[0] != story_id
+    assert stage_media(_openers({"a.png": b'aaa', "b.png": b'bbb'}), ["b.png", "a.png"], str(second))[0] != story_id
+    assert set(digests) == {"a.png", "b.png"}
+
+
+def test_stage_media_skips_unsafe_names(tmp_path):
+    names = ['', '.', '..', 'sub/x.png', 'ok.png']
+    _, staged, _ = stage_media(_openers({name: b'data' for name in names}), names, str(tmp_path))
+    assert staged == ['ok.png']
+    assert os.listdir(tmp_path) == ['ok.png']
+
+
+def test_claims_are_per_format(tmp_path):
+    store = StoryStore(str(tmp_path), 10_000)
+    started = []
+
+    def start(formats):
+        started.append(list(formats))
+        return f"job{len(started)}"
+
+    assert store.claim('s', ['html'], start) == {'html': 'job1'}
+    assert store.claim('s', ['html', 'pdf'], start) == {'html': 'job1', 'pdf': 'job2'}
+    assert started == [['html'], ['pdf']]
+    store.release('s', ['html'])
+    assert store.claim('s', ['html', 'pdf'], start) == {'html': 'job3', 'pdf': 'job2'}
+
+
+def test_publish_get_and_evict(tmp_path):
+    store = StoryStore(str(tmp_path / 'stories'), 1500)
+    old, new = 'a' * 64, 'b' * 64
+    for story_id in (old, new):
+        deck = tmp_path / f'{story_id}.html'
+        deck.write_bytes(b'x' * 1000)
+        store.publish(story_id, {'html': str(deck)})
+        then = time.time() - (100 if story_id == old else 0)
+        os.utime(os.path.dirname(store.path(story_id, 'html')), (then, then))
+    assert store.get(old, 'html') is None
+    assert open(store.get(new, 'html'), 'rb').read() == b'x' * 1000
+    assert store.get(new, 'pdf') is None
+    assert store.get('../' + new[3:], 'html') is None
+    assert store.missing(new, ['html', 'pdf']) == ['pdf']
+
+
+@pytest.fixture(scope='module')
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+    return TestClient(app)
+
+
+def test_story_round_trip_with_range(client):
+    Image = pytest.importorskip('PIL.Image')
+    buf = io.BytesIO()
+    Image.new('RGB', (40, 30), (200, 40, 40)).save(buf, 'PNG')
+    created = client.post('/story?formats=html', files=[('files', ('a.png', buf.getvalue(), 'image/png'))])
+    assert created.status_code == 202
+    job_id, url = created.json()["job_id"], created.json()["urls"]["html"]
+    for _ in range(200):
+        if client.get(f'/jobs/{job_id}').json()["status"] in ('done', 'failed'):
+            break
+        time.sleep(0.05)
+    whole = client.get(url)
+    assert whole.status_code == 200
+    part = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert part.status_code == 206
+    assert part.content == whole.content[:10]
+    # The same media again is served from the cache
+    again = client.post('/story?formats=html', files=[('files', ('a.png', buf.getvalue(), 'image/png'))])
+    assert again.status_code == 200
+    assert again.json()["status"] == "done"
+
+
+def test_story_rejects_directory_names(client):
+    for name in ('..', '.'):
+        response = client.post('/story?formats=html', files=[('files', (name, b'\x89PNG', 'image/png'))])
+        assert response.status_code == 400
+    assert client.get(f'/story/{"0" * 64}.html').status_code == 404
@@ -0,0 +1,36 @@
+def fix_text(text):
+    if not isinstance(text, str) or not text:
+        return text
+    # Pure ASCII round-trips unchanged, skip the encode/decode
+    if text.isascii():
+        return text
+    try:
+        # Facebook JSON often encodes UTF-8 bytes as Latin-1 characters.
+        return text.encode('latin1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        try:
+            return text.encode('cp1252').decode('utf-8')
+        except:
+            return text
+
+# Repaired sender/actor names. A chat only has a handful of participants, so
+# this stays tiny; it is simply reset if something feeds it arbitrary strings.
+_NAME_CACHE_MAX = 4096
+_name_cache = {}
+
+def fix_name(name):
+    """fix_text for participant names, memoized."""
+    if not isinstance(name, str):
+        return fix_text(name)
+    fixed = _name_cache.get(name)
+    if fixed is None:
+        if len(_name_cache) >= _NAME_CACHE_MAX:
+            _name_cache.clear()
+        fixed = _name_cache[name] = fix_text(name)
+    return fixed
+
+def is_url(text):
+    if not isinstance(text, str):
+        return False
+    text_lower = text.lower()
+    return text_lower.startswith('http') or text_lower.startswith('www') or '://' in text_lower
@@ -0,0 +1,107 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Phases reported in the timings block and /metrics, in pipeline order
+PHASES = ('parse', 'tokenize', 'reactions', 'media', 'chronological', 'rankings', 'network')
+
+# Per-message phases are timed on one message in this many and scaled up,
+# which keeps the clock reads to well under 1% of the analysis
+SAMPLE_EVERY = 8
+
+
+class Timings:
+    """
+    Wall and CPU seconds per phase plus work counters for one analysis.
+
+    Picklable, so a worker process can send its timings back with the
+    partial it built; merge() adds them up.
+    """
+
+    def __init__(self):
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.counters = defaultdict(int)
+        self._open = []
+
+    def add(self, phase, wall, cpu):
+        self.wall[phase] += wall
+        self.cpu[phase] += cpu
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block; time spent in phases nested inside it isn't counted twice."""
+        frame = [time.perf_counter(), time.thread_time(), 0.0, 0.0]
+        self._open.append(frame)
+        try:
+            yield
+        finally:
+            self._open.pop()
+            wall = time.perf_counter() - frame[0]
+            cpu = time.thread_time() - frame[1]
+            self.add(name, wall - frame[2], cpu - frame[3])
+            if self._open:
+                self._open[-1][2] += wall
+                self._open[-1][3] += cpu
+
+    def merge(self, other):
+        for phase, value in other.wall.items():
+            self.wall[phase] += value
+        for phase, value in other.cpu.items():
+            self.cpu[phase] += value
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        return self
+
+    def as_dict(self):
+        return {
+            "phases": {
+                phase: {"wall_s": round(self.wall[phase], 4), "cpu_s": round(self.cpu[phase], 4)}
+                for phase in PHASES if phase in self.wall
+            },
+            "counters": dict(self.counters),
+        }
+
+
+class SampledClock:
+    """
+    Times the per-message phases of an analysis on every SAMPLE_EVERY-th
+    message. Call start() before a message, lap(phase) after each phase of
+    it, and flush() at the end to scale the samples up into a Timings.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.sampled = 0
+        self.seen = 0
+        self.active = False
+        self._wall = self._cpu = 0.0
+        self._phases = defaultdict(lambda: [0.0, 0.0])
+
+    def start(self):
+        self.active = self.seen % SAMPLE_EVERY == 0
+        self.seen += 1
+        if self.active:
+            self.sampled += 1
+            self._wall, self._cpu = time.perf_counter(), time.thread_time()
+        return self.active
+
+    def lap(self, phase):
+        if not self.active:
+            return
+        wall, cpu = time.perf_counter(), time.thread_time()
+        totals = self._phases[phase]
+        totals[0] += wall - self._wall
+        totals[1] += cpu - self._cpu
+        self._wall, self._cpu = wall, cpu
+
+    def flush(self):
+        if self.sampled:
+            scale = self.seen / self.sampled
+            for phase, (wall, cpu) in self._phases.items():
+                self.timings.add(phase, wall * scale, cpu * scale)
+        self._phases.clear()
+        self.sampled = self.seen = 0
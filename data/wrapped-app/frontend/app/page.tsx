@@ -86,7 +86,7 @@ export default function Home() {
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files) {
-      const newFiles = Array.from(e.target.files).filter(f => f.name.endsWith('.json'));
+      const newFiles = Array.from(e.target.files).filter(f => /\.(json|zip|gz)$/i.test(f.name));
       setFiles(prev => [...prev, ...newFiles]);
 
       animate('.upload-container', {
@@ -194,7 +194,7 @@ export default function Home() {
               <div className="space-y-6 md:space-y-10">
                 <label className="wrapped-card block p-6 sm:p-12 md:p-24 cursor-pointer relative overflow-hidden group bg-white">
                   <div className="absolute inset-0 bg-wrapped-blue/10 opacity-0 group-hover:opacity-100 transition-opacity" />
-                  <input type="file" multiple accept=".json" className="hidden" onChange={handleFileChange} />
+                  <input type="file" multiple accept=".json,.zip,.gz" className="hidden" onChange={handleFileChange} />
                   <div className="flex flex-col items-center space-y-12 relative z-10">
                     <div className="p-12 bg-black text-white rounded-[2.5rem] group-hover:scale-110 group-hover:rotate-6 transition-all duration-500 shadow-2xl">
                       <Upload className="w-20 h-20" />